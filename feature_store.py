@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# 固定的特征列和类型，保证所有分区文件的 schema 一致
+FEATURE_SCHEMA = pa.schema([
+    ('ts', pa.timestamp('ms', tz='UTC')),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('sma_10', pa.float64()),
+    ('rsi', pa.float64()),
+    ('total_bid_volume', pa.float64()),
+    ('total_ask_volume', pa.float64()),
+    ('bid_ask_spread', pa.float64()),
+    ('tweet_count', pa.int32()),
+    ('positive_ratio', pa.float64()),
+    ('negative_ratio', pa.float64()),
+    ('kol_count', pa.int32()),
+    ('tx_count', pa.int32()),
+    ('large_tx_count', pa.int32()),
+    ('new_token_count', pa.int32()),
+    ('ai_signal', pa.string()),
+    ('action', pa.string()),
+    ('amount', pa.float64()),
+    ('sentiment_5m', pa.float64()),
+    ('sentiment_1h', pa.float64()),
+    ('sentiment_24h', pa.float64()),
+    ('mention_velocity', pa.float64()),
+    ('mention_acceleration', pa.float64())
+])
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('symbol', pa.string())]), flavor='hive')
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
+def build_feature_row(processed_market_data: Dict, processed_on_chain_data: Dict,
+                      processed_social_media_data: List[Dict], ai_signal=None,
+                      trading_instruction: Optional[Dict] = None, sentiment_summary: Optional[Dict] = None) -> Dict:
+    """把一个周期的处理结果和决策压平成一行特征"""
+    klines = processed_market_data.get("processed_klines") or [{}]
+    last = klines[-1]
+    book = processed_market_data.get("order_book_summary", {})
+    tweets = processed_social_media_data or []
+    tweet_count = len(tweets)
+    transactions = processed_on_chain_data.get("processed_transactions", [])
+    instruction = trading_instruction or {}
+    sentiment = sentiment_summary or {}
+
+    return {
+        'ts': datetime.now(timezone.utc),
+        'close': _to_float(last.get("close")),
+        'volume': _to_float(last.get("volume")),
+        'sma_10': _to_float(last.get("SMA_10")),
+        'rsi': _to_float(last.get("RSI")),
+        'total_bid_volume': _to_float(book.get("total_bid_volume")),
+        'total_ask_volume': _to_float(book.get("total_ask_volume")),
+        'bid_ask_spread': _to_float(book.get("bid_ask_spread")),
+        'tweet_count': tweet_count,
+        'positive_ratio': sum(t.get("sentiment") == "positive" for t in tweets) / tweet_count if tweet_count else None,
+        'negative_ratio': sum(t.get("sentiment") == "negative" for t in tweets) / tweet_count if tweet_count else None,
+        'kol_count': sum(bool(t.get("is_kol")) for t in tweets),
+        'tx_count': len(transactions),
+        'large_tx_count': sum(bool(tx.get("is_large_transaction")) for tx in transactions),
+        'new_token_count': len(processed_on_chain_data.get("new_token_deployments", [])),
+        'ai_signal': None if ai_signal is None else str(ai_signal),
+        'action': instruction.get("action"),
+        'amount': _to_float(instruction.get("amount")),
+        'sentiment_5m': _to_float(sentiment.get('5m', {}).get('weighted_sentiment')),
+        'sentiment_1h': _to_float(sentiment.get('1h', {}).get('weighted_sentiment')),
+        'sentiment_24h': _to_float(sentiment.get('24h', {}).get('weighted_sentiment')),
+        'mention_velocity': _to_float(sentiment.get('mention_velocity')),
+        'mention_acceleration': _to_float(sentiment.get('mention_acceleration'))
+    }
+
+
+def _as_utc(value) -> datetime:
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+    return timestamp.to_pydatetime()
+
+
+class FeatureStore:
+    """只追加的列式特征库
+
+    每个周期的特征和决策先缓存在内存，达到行数或时间阈值后批量写成
+    Parquet 文件，按 date=YYYY-MM-DD/symbol=XXX 分区。时间阈值应远大于
+    机器人的周期间隔，否则每次刷盘每个分区只有一两行。某个分区的文件数
+    超过 compact_files 时合并为一个文件。读取时只加载需要的列，并用分区
+    和时间戳过滤，训练和分析可以直接扫描大量历史数据。
+    """
+
+    def __init__(self, root: str = 'data/features', flush_rows: int = 5000, flush_interval: float = 3600.0,
+                 compact_files: int = 8):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.compact_files = compact_files
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, symbol: str, row: Dict) -> bool:
+        """缓存一行特征，返回是否已达到刷盘条件"""
+        with self._lock:
+            self._buffer.append({**row, 'symbol': symbol})
+            return self.should_flush()
+
+    def should_flush(self) -> bool:
+        return len(self._buffer) >= self.flush_rows or \
+            (self._buffer and time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush(self) -> int:
+        """把缓存的行按分区写成 Parquet 文件，返回写入行数"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return 0
+
+        frame = pd.DataFrame(rows)
+        # datetime.now() 带微秒，schema 为毫秒精度，先截断否则转换时报错
+        frame['ts'] = pd.to_datetime(frame['ts'], utc=True).dt.floor('ms')
+        frame['date'] = frame['ts'].dt.strftime('%Y-%m-%d')
+        written = set()
+        try:
+            for (date, symbol), group in frame.groupby(['date', 'symbol'], sort=False):
+                table = pa.Table.from_pandas(group.drop(columns=['date', 'symbol']), schema=FEATURE_SCHEMA,
+                                             preserve_index=False)
+                directory = os.path.join(self.root, f"date={date}", f"symbol={symbol}")
+                os.makedirs(directory, exist_ok=True)
+                # 先写以 . 开头的临时文件再改名，读者不会看到写了一半的文件
+                filename = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+                tmp_path = os.path.join(directory, f".{filename}.tmp")
+                pq.write_table(table, tmp_path, compression='zstd')
+                os.replace(tmp_path, os.path.join(directory, filename))
+                written.update(group.index)
+        except OSError:
+            # 磁盘类错误通常是暂时的，未写出的行放回缓冲区等下次重试
+            pending = [row for i, row in enumerate(rows) if i not in written]
+            with self._lock:
+                self._buffer[:0] = pending
+            raise
+        logger.info("特征库写入 %d 行", len(rows))
+
+        for date, symbol in frame[['date', 'symbol']].drop_duplicates().itertuples(index=False):
+            try:
+                self.compact(os.path.join(self.root, f"date={date}", f"symbol={symbol}"))
+            except OSError as e:
+                # 合并失败不影响已写入的数据，下次刷盘再试
+                logger.warning("特征分区合并失败 %s/%s: %s", date, symbol, e)
+        return len(rows)
+
+    def compact(self, directory: str, min_files: Optional[int] = None) -> bool:
+        """分区内文件数达到阈值时合并为一个文件，返回是否合并
+
+        合并文件先写临时文件再改名，之后才删除旧文件；中途崩溃最多留下
+        重复行，不会丢数据。
+        """
+        min_files = min_files or self.compact_files
+        parts = sorted(entry.path for entry in os.scandir(directory)
+                       if entry.name.startswith('part-') and entry.name.endswith('.parquet'))
+        if len(parts) < min_files:
+            return False
+        table = pa.concat_tables(pq.read_table(path, schema=FEATURE_SCHEMA) for path in parts)
+        filename = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(directory, f".{filename}.tmp")
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, os.path.join(directory, filename))
+        for path in parts:
+            os.remove(path)
+        return True
+
+    def read(self, start: datetime, end: datetime, columns: Optional[List[str]] = None,
+             symbols: Optional[List[str]] = None) -> pd.DataFrame:
+        """按时间范围读取指定列"""
+        if not os.path.isdir(self.root) or not any(os.scandir(self.root)):
+            return pd.DataFrame(columns=columns or FEATURE_SCHEMA.names)
+        schema = FEATURE_SCHEMA.append(pa.field('date', pa.string())).append(pa.field('symbol', pa.string()))
+        dataset = ds.dataset(self.root, format='parquet', schema=schema, partitioning=PARTITIONING)
+
+        start, end = _as_utc(start), _as_utc(end)
+        # 日期分区过滤跳过整个目录，时间戳过滤再裁剪边界
+        condition = (ds.field('date') >= start.strftime('%Y-%m-%d')) & (ds.field('date') <= end.strftime('%Y-%m-%d')) \
+            & (ds.field('ts') >= pa.scalar(start, pa.timestamp('ms', tz='UTC'))) \
+            & (ds.field('ts') <= pa.scalar(end, pa.timestamp('ms', tz='UTC')))
+        if symbols:
+            condition &= ds.field('symbol').isin(symbols)
+
+        wanted = columns or [name for name in dataset.schema.names if name != 'date']
+        return dataset.to_table(columns=wanted, filter=condition).to_pandas()
+
+
+async def main():
+    import random
+    import tempfile
+    from datetime import timedelta
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FeatureStore(root=tmp, flush_rows=50000)
+
+        # Example usage: log 200k synthetic cycles across two days
+        started = time.perf_counter()
+        base = datetime(2026, 10, 18, tzinfo=timezone.utc)
+        for i in range(200000):
+            row = {name: random.random() for name in FEATURE_SCHEMA.names if FEATURE_SCHEMA.field(name).type == pa.float64()}
+            row.update({'ts': base + timedelta(seconds=i, microseconds=random.randint(0, 999999)),
+                        'tweet_count': 50, 'kol_count': 2, 'tx_count': 10, 'large_tx_count': 1, 'new_token_count': 0, 'ai_signal': 'BUY', 'action': 'HOLD'})
+            if store.append(random.choice(["DOGEUSDT", "PEPEUSDT", "SHIBUSDT"]), row):
+                store.flush()
+        store.flush()
+        print(f"Wrote 200000 rows in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        frame = store.read(base + timedelta(hours=12), base + timedelta(hours=36), columns=['ts', 'close', 'rsi', 'symbol'])
+        print(f"Read {len(frame)} rows x {len(frame.columns)} columns in {(time.perf_counter() - started) * 1000:.1f} ms")
+        print(frame.head())
+
+if __name__ == "__main__":
+    asyncio.run(main())
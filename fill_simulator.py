@@ -0,0 +1,153 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FillSimulator:
+    """基于盘口深度的模拟成交引擎
+
+    市价单逐档吃掉对手盘，计算成交均价(VWAP)、部分成交、滑点和手续费。
+    可选地模拟排队（每档前方已有挂单占用的比例）和下单延迟带来的不利
+    价格漂移。批量接口把所有币种的盘口对齐成二维数组，一次性计算整个
+    币种池的成交结果。
+    """
+
+    def __init__(self, fee_rate: float = 0.001, depth_levels: int = 50,
+                 latency_ms: float = 0.0, queue_ahead_ratio: float = 0.0,
+                 adverse_bps_per_ms: float = 0.0):
+        self.fee_rate = fee_rate
+        self.depth_levels = depth_levels
+        self.latency_ms = latency_ms
+        self.queue_ahead_ratio = queue_ahead_ratio
+        self.adverse_bps_per_ms = adverse_bps_per_ms
+
+    def _book_side(self, order_book: Dict, is_buy: bool):
+        """取出对手盘，返回价格和数量数组"""
+        levels = order_book.get("asks" if is_buy else "bids", [])[:self.depth_levels]
+        if not levels:
+            return np.empty(0), np.empty(0)
+        side = np.asarray(levels, dtype=np.float64)
+        return side[:, 0], side[:, 1]
+
+    def simulate(self, order_book: Dict, quantity: float, is_buy: bool) -> Dict:
+        """模拟单个市价单的成交"""
+        prices, sizes = self._book_side(order_book, is_buy)
+        width = max(len(prices), 1)
+        price_matrix = np.zeros((1, width))
+        size_matrix = np.zeros((1, width))
+        price_matrix[0, :len(prices)] = prices
+        size_matrix[0, :len(sizes)] = sizes
+        mid = self._mid_price(order_book)
+        results = self._fill(price_matrix, size_matrix, np.array([quantity], dtype=np.float64),
+                             np.array([is_buy]), np.array([mid]))
+        return {key: value[0].item() for key, value in results.items()}
+
+    def simulate_batch(self, order_books: Dict[str, Dict], orders: Dict[str, Dict]) -> Dict[str, Dict]:
+        """对整个币种池一次性模拟成交
+
+        orders: {coin: {'quantity': float, 'is_buy': bool}}
+        """
+        coins = [coin for coin in orders if coin in order_books]
+        if not coins:
+            return {}
+
+        sides = [self._book_side(order_books[coin], orders[coin]['is_buy']) for coin in coins]
+        width = max(max((len(prices) for prices, _ in sides), default=0), 1)
+        price_matrix = np.zeros((len(coins), width))
+        size_matrix = np.zeros((len(coins), width))
+        for row, (prices, sizes) in enumerate(sides):
+            price_matrix[row, :len(prices)] = prices
+            size_matrix[row, :len(sizes)] = sizes
+
+        quantities = np.array([orders[coin]['quantity'] for coin in coins], dtype=np.float64)
+        is_buy = np.array([orders[coin]['is_buy'] for coin in coins])
+        mids = np.array([self._mid_price(order_books[coin]) for coin in coins])
+        results = self._fill(price_matrix, size_matrix, quantities, is_buy, mids)
+
+        return {
+            coin: {key: value[row].item() for key, value in results.items()}
+            for row, coin in enumerate(coins)
+        }
+
+    def _mid_price(self, order_book: Dict) -> float:
+        bids = order_book.get("bids", [])
+        asks = order_book.get("asks", [])
+        if bids and asks:
+            return (float(bids[0][0]) + float(asks[0][0])) / 2
+        if asks:
+            return float(asks[0][0])
+        if bids:
+            return float(bids[0][0])
+        return 0.0
+
+    def _fill(self, prices: np.ndarray, sizes: np.ndarray, quantities: np.ndarray,
+              is_buy: np.ndarray, mids: np.ndarray) -> Dict[str, np.ndarray]:
+        """核心逐档撮合，输入为 币种 × 档位 的矩阵"""
+        # 排队：每档前方已有的挂单先于我们成交
+        available = sizes * (1.0 - self.queue_ahead_ratio)
+
+        # 延迟：价格在下单途中向不利方向漂移
+        drift = self.adverse_bps_per_ms * self.latency_ms / 10000
+        direction = np.where(is_buy, 1.0, -1.0)
+        exec_prices = prices * (1.0 + direction[:, None] * drift)
+
+        consumed_before = np.cumsum(available, axis=1) - available
+        fills = np.clip(quantities[:, None] - consumed_before, 0.0, available)
+        filled = fills.sum(axis=1)
+        notional = (fills * exec_prices).sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = np.where(filled > 0, notional / filled, 0.0)
+            slippage_bps = np.where((filled > 0) & (mids > 0), direction * (vwap - mids) / mids * 10000, 0.0)
+        levels_used = np.count_nonzero(fills, axis=1)
+
+        return {
+            'filled_quantity': filled,
+            'unfilled_quantity': quantities - filled,
+            'vwap': vwap,
+            'notional': notional,
+            'fee': notional * self.fee_rate,
+            'slippage_bps': slippage_bps,
+            'levels_consumed': levels_used,
+            'partial': filled < quantities,
+            'delay_ms': np.full(len(quantities), float(self.latency_ms))
+        }
+
+
+def make_synthetic_order_book(mid_price: float, levels: int = 20, tick_pct: float = 0.001,
+                              base_size: float = 1000.0, seed: Optional[int] = None) -> Dict:
+    """生成一个合成盘口，用于模拟盘和演示"""
+    rng = np.random.default_rng(seed)
+    steps = np.arange(1, levels + 1)
+    bid_prices = mid_price * (1 - steps * tick_pct)
+    ask_prices = mid_price * (1 + steps * tick_pct)
+    bid_sizes = base_size * rng.uniform(0.2, 2.0, levels) * steps ** 0.5
+    ask_sizes = base_size * rng.uniform(0.2, 2.0, levels) * steps ** 0.5
+    return {
+        "bids": np.column_stack([bid_prices, bid_sizes]).tolist(),
+        "asks": np.column_stack([ask_prices, ask_sizes]).tolist()
+    }
+
+
+async def main():
+    simulator = FillSimulator(fee_rate=0.001, latency_ms=150, queue_ahead_ratio=0.2, adverse_bps_per_ms=0.01)
+
+    # Example: single order against a thin book
+    order_book = make_synthetic_order_book(0.0001, levels=10, base_size=500000, seed=1)
+    print("\nSingle Fill:")
+    print(simulator.simulate(order_book, quantity=5000000, is_buy=True))
+
+    # Example: whole universe on one tick
+    universe = 5000
+    order_books = {f"COIN{i}": make_synthetic_order_book(0.0001 * (1 + i % 7), seed=i) for i in range(universe)}
+    orders = {coin: {'quantity': 20000, 'is_buy': i % 2 == 0} for i, coin in enumerate(order_books)}
+    started = time.perf_counter()
+    results = simulator.simulate_batch(order_books, orders)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    partial = sum(1 for result in results.values() if result['partial'])
+    print(f"\nSimulated {len(results)} fills in {elapsed_ms:.1f} ms ({partial} partial)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
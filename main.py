@@ -1,6 +1,5 @@
 import asyncio
 import os
-import json
 import threading
 import logging
 from datetime import datetime
@@ -18,10 +17,15 @@ from ai_signal_generator import AISignalGenerator
 from on_chain_scanner import OnChainScanner
 from twitter_monitor import TwitterMonitor
 from chatgpt_decision_support import ChatGPTDecisionSupport
-from strategy_executor import StrategyExecutor
+from order_execution import ExecutionEngine
 from risk_manager import RiskManager
-from telegram_notifier import TelegramNotifier
-from monitoring_logging import MonitoringLogging
+from position_ledger import PositionLedger
+from feature_store import FeatureStore, build_feature_row
+from sentiment_aggregator import SentimentAggregator
+from rate_governor import PRIORITY_HIGH, PRIORITY_NORMAL
+from market_cache import cache
+from notification_queue import NotificationQueue, PRIORITY_TRADE, PRIORITY_DIGEST
+from structured_logging import StructuredLogger, setup_logging, start_cycle, set_stage
 
 # Initialize database
 db = SQLAlchemy()
@@ -84,79 +88,175 @@ class MemeCoinTradingBot:
             self.twitter_consumer_key, self.twitter_consumer_secret, self.twitter_access_token, self.twitter_access_token_secret
         )
         self.chatgpt_decision_support = ChatGPTDecisionSupport(api_key=self.openai_api_key)
-        self.strategy_executor = StrategyExecutor("binance", self.binance_api_key, self.binance_secret_key)
+        self.execution_engine = ExecutionEngine(self.binance_api_key, self.binance_secret_key)
         self.risk_manager = RiskManager()
-        self.telegram_notifier = TelegramNotifier(self.telegram_bot_token, self.telegram_chat_id)
-        self.logger = MonitoringLogging()
+        self.position_ledger = PositionLedger()
+        self.market_state = None  # SharedMarketState when running as a shard worker
+        self.sentiment_aggregator = SentimentAggregator()
+        # Flush well after the 300 s cycle so each part file holds many rows per partition
+        self.feature_store = FeatureStore(root=os.getenv("FEATURE_STORE_DIR", "data/features"),
+                                          flush_rows=1000,
+                                          flush_interval=float(os.getenv("FEATURE_FLUSH_INTERVAL", 6 * 3600)))
+        self.notification_queue = NotificationQueue(self.telegram_bot_token, self.telegram_chat_id)
+        self.logger = StructuredLogger()
 
         self.logger.log_info("MemeCoinTradingBot initialized.")
 
     async def run_once(self, symbol="DOGEUSDT", twitter_query="#DOGE OR #DOGECOIN"):
-        self.logger.log_info(f"Running bot cycle for {symbol}...")
+        start_cycle(symbol)
+        self.logger.log_info("Running bot cycle for %s...", symbol)
 
         # 1. Data Acquisition
-        market_data = await self.market_data_collector.collect_market_data("binance", symbol)
+        set_stage("acquisition")
+        if self.market_state:
+            # Sharded mode: positions live in shared memory so they follow a symbol to its new
+            # worker, and exposure/drawdown limits apply to the whole book, not this process's share
+            self.position_ledger.sync_positions(self.market_state.get_positions())
+        # Depth for symbols with an open position goes ahead of routine scans
+        position = self.position_ledger.get_position(symbol)
+        priority = PRIORITY_HIGH if position and position["quantity"] else PRIORITY_NORMAL
+        market_data = await self.market_data_collector.collect_market_data("binance", symbol, priority=priority)
+        if self.market_state:
+            self.market_state.publish_market_data(symbol, market_data)
         on_chain_data = await self.on_chain_data_collector.collect_on_chain_data()
         social_media_tweets = self.social_media_data_collector.search_tweets(twitter_query, count=50)
 
         # 2. Data Processing
+        set_stage("processing")
         processed_market_data = self.data_processor.process_market_data(market_data["klines"], market_data["order_book"])
         processed_on_chain_data = self.data_processor.process_on_chain_data(on_chain_data)
         processed_social_media_data = self.data_processor.process_social_media_data(social_media_tweets)
+        # Rolling influence-weighted sentiment; tweets re-fetched by later cycles are deduplicated by id
+        self.sentiment_aggregator.add_tweets(symbol, processed_social_media_data)
+        sentiment_summary = self.sentiment_aggregator.summary(symbol)
+        self.logger.log_info("Social sentiment 5m/1h/24h: %.2f/%.2f/%.2f, mention velocity %.1f/min",
+                             sentiment_summary["5m"]["weighted_sentiment"], sentiment_summary["1h"]["weighted_sentiment"],
+                             sentiment_summary["24h"]["weighted_sentiment"], sentiment_summary["mention_velocity"])
+
+        # Mark open positions to the latest close
+        processed_klines = processed_market_data["processed_klines"]
+        current_price = float(processed_klines[-1]["close"]) if processed_klines else None
+        if self.market_state:
+            # Sharded mode: mark every position from the shared-memory quotes
+            self.position_ledger.mark_to_market(self.market_state.get_prices())
+        elif current_price:
+            self.position_ledger.mark_to_market({symbol: current_price})
 
         # 3. AI Signal Generation
+        set_stage("signal")
         # For demonstration, we need to train the model first if not already trained
         # In a real scenario, model training would be a separate, scheduled process
+        # reading the history accumulated by self.feature_store (see FeatureStore.read)
         # self.ai_signal_generator.train_model(self.ai_signal_generator.load_data(processed_market_data, processed_on_chain_data, processed_social_media_data))
         ai_signal = self.ai_signal_generator.generate_signal(processed_market_data, processed_on_chain_data, processed_social_media_data)
-        self.logger.log_info(f"AI Signal: {ai_signal}")
+        self.logger.log_info("AI Signal: %s", ai_signal)
 
         # 4. On-chain Scanning (example usage)
+        set_stage("on_chain")
         latest_block_number = await self.on_chain_scanner.get_latest_block_number()
         new_tokens = await self.on_chain_scanner.detect_new_token_deployments(latest_block_number)
         whale_activities = await self.on_chain_scanner.track_whale_addresses(latest_block_number, ["0xYourWhaleAddress1"])
-        self.logger.log_info(f"New Tokens Detected: {len(new_tokens)}")
-        self.logger.log_info(f"Whale Activities: {len(whale_activities)}")
+        self.logger.log_info("New Tokens Detected: %d", len(new_tokens))
+        self.logger.log_info("Whale Activities: %d", len(whale_activities))
 
         # 5. Twitter Monitoring (example usage)
+        set_stage("social")
         twitter_monitoring_results = await self.twitter_monitor.monitor_tweets_for_meme_coin(twitter_query, count=20)
-        self.logger.log_info(f'Twitter Sentiment: {twitter_monitoring_results.get("analyzed_tweets", [])[0].get("sentiment") if twitter_monitoring_results.get("analyzed_tweets") else "N/A"}')
+        analyzed_tweets = twitter_monitoring_results.get("analyzed_tweets")
+        self.logger.log_info("Twitter Sentiment: %s", analyzed_tweets[0].get("sentiment") if analyzed_tweets else "N/A")
+        set_stage("decision")
         trading_advice = await self.chatgpt_decision_support.generate_trading_advice(
             processed_market_data, processed_on_chain_data, twitter_monitoring_results, ai_signal
         )
-        self.logger.log_info(f"ChatGPT Trading Advice: {trading_advice}")
+        self.logger.log_info("ChatGPT Trading Advice: %s", trading_advice)
 
         trading_instruction = await self.chatgpt_decision_support.generate_trading_instruction(trading_advice)
-        self.logger.log_info(f"ChatGPT Trading Instruction: {json.dumps(trading_instruction)}")
+        self.logger.log_info("ChatGPT Trading Instruction: %s", trading_instruction)
 
         # 7. Strategy Execution and Risk Management
+        set_stage("execution")
         if trading_instruction and trading_instruction.get("action") in ["BUY", "SELL"]:
             # Example: calculate position size based on risk manager (simplified)
             # This would need actual current price and stop loss from the instruction or market data
             # For demonstration, we'll use a fixed amount
             amount_to_trade = trading_instruction.get("amount", 0.001) # Default small amount
-            trade_result = await self.strategy_executor.execute_trade(trading_instruction)
-            self.logger.log_info(f"Trade Result: {trade_result}")
-            
-            # Update risk manager positions (simplified)
-            if trade_result and trade_result["status"] == "EXECUTED":
-                # This part needs real price and amount from the executed order
-                # For now, just a placeholder
-                # self.risk_manager.update_position(symbol, amount_to_trade, current_price, is_buy=(trading_instruction["action"] == "BUY"))
-                pass
+            is_buy = trading_instruction["action"] == "BUY"
+
+            # Pre-trade risk check against the in-memory ledger
+            risk_check = self.position_ledger.check_order(symbol, amount_to_trade, current_price, is_buy)
+            if not risk_check["allowed"]:
+                self.logger.log_info("Trade rejected by risk check: %s", risk_check['reason'])
+            else:
+                trade_result = await self.execution_engine.execute_instruction(symbol, trading_instruction)
+                self.logger.log_info("Trade Result: %s", trade_result)
+
+                # Update ledger positions with the executed fill
+                if trade_result and trade_result["status"] == "EXECUTED":
+                    fill_price = trade_result.get("price") or current_price
+                    if fill_price:
+                        position = self.position_ledger.apply_fill(
+                            symbol, trade_result.get("amount", amount_to_trade), fill_price,
+                            is_buy=is_buy, fee=trade_result.get("fee", 0.0)
+                        )
+                        if self.market_state:
+                            self.market_state.publish_position(symbol, position)
+                        self.logger.log_info("Ledger Summary: %s", self.position_ledger.get_summary())
+                    self.notification_queue.publish(
+                        f"Trade filled: {trading_instruction['action']} {trade_result.get('amount')} {symbol} @ {fill_price}",
+                        priority=PRIORITY_TRADE
+                    )
         else:
             self.logger.log_info("No trade executed based on instruction.")
 
-        # 8. Notifications
-        await self.telegram_notifier.send_message(f"Bot cycle completed for {symbol}. AI Signal: {ai_signal}. Trading Instruction: {trading_instruction.get('action')}")
+        # Feature logging: buffer this cycle's features and decision, flush batches off the loop
+        set_stage("feature_logging")
+        feature_row = build_feature_row(processed_market_data, processed_on_chain_data,
+                                        processed_social_media_data, ai_signal, trading_instruction,
+                                        sentiment_summary)
+        if self.feature_store.append(symbol, feature_row):
+            await self._flush_features()
+
+        # 8. Notifications (queued; coalesced into digests by the background sender)
+        set_stage("notification")
+        self.notification_queue.publish(
+            f"Bot cycle completed for {symbol}. AI Signal: {ai_signal}. Trading Instruction: {trading_instruction.get('action')}",
+            priority=PRIORITY_DIGEST
+        )
+
+        self.logger.log_info("Bot cycle for %s finished.", symbol, cache=cache.get_stats())
+
+    async def start(self):
+        """Start background services; call once before the first cycle"""
+        # Warm the pooled exchange session before the first cycle
+        await self.execution_engine.start()
+        await self.notification_queue.start()
 
-        self.logger.log_info(f"Bot cycle for {symbol} finished.")
+    async def stop(self):
+        """Flush buffered features, drain notifications and close sessions"""
+        await self._flush_features()
+        await self.notification_queue.stop()
+        await self.execution_engine.close()
+
+    async def _flush_features(self):
+        # Flush off the event loop; a storage or schema error must not end the bot loop
+        try:
+            await asyncio.to_thread(self.feature_store.flush)
+        except Exception as e:
+            self.logger.log_error("Feature store flush failed: %s", e)
 
     async def run_continuously(self, interval_seconds=300, symbol="DOGEUSDT", twitter_query="#DOGE OR #DOGECOIN"):
-        while True:
-            await self.run_once(symbol, twitter_query)
-            self.logger.log_info(f"Waiting for {interval_seconds} seconds before next cycle...")
-            await asyncio.sleep(interval_seconds)
+        await self.start()
+        try:
+            while True:
+                try:
+                    await self.run_once(symbol, twitter_query)
+                except Exception as e:
+                    # One failed cycle (bad upstream response, parse error) must not end the bot
+                    self.logger.log_error("Bot cycle for %s failed: %s", symbol, e)
+                self.logger.log_info("Waiting for %d seconds before next cycle...", interval_seconds)
+                await asyncio.sleep(interval_seconds)
+        finally:
+            await self.stop()
 
 def create_app():
     app = Flask(__name__, 
@@ -234,6 +334,18 @@ def create_app():
             'version': '1.0.0'
         }
     
+    # 共享内存行情（分片模式下由 worker 写入）
+    @app.route('/api/market/prices')
+    def market_prices():
+        """最新行情价格"""
+        shm_name = os.getenv('MARKET_STATE_SHM')
+        if not shm_name:
+            return {'error': 'Market state not available'}, 503
+        if 'market_state' not in app.extensions:
+            from shard_supervisor import SharedMarketState
+            app.extensions['market_state'] = SharedMarketState.attach(shm_name)
+        return {'prices': app.extensions['market_state'].get_prices()}
+    
     # SPA路由处理
     @app.errorhandler(404)
     def not_found_error(error):
@@ -253,16 +365,8 @@ async def main():
     await bot.run_continuously(interval_seconds=300) # Run every 5 minutes
 
 if __name__ == "__main__":
-    # 配置日志
-    os.makedirs('logs', exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('logs/trading_bot.log'),
-            logging.StreamHandler()
-        ]
-    )
+    # 配置日志（队列化，后台线程写入按大小轮转的 JSON Lines 文件）
+    setup_logging(log_dir='logs')
     
     # 检查是否运行Web应用
     if os.getenv('RUN_WEB_APP') == 'true':
@@ -297,6 +401,13 @@ if __name__ == "__main__":
             debug=debug_mode,
             ssl_context='adhoc' if os.getenv('USE_SSL') == 'true' else None
         )
+    elif int(os.getenv('SHARD_WORKERS', '1')) > 1:
+        # 多进程分片运行，行情写入共享内存（Web 应用通过 MARKET_STATE_SHM 挂载）
+        from shard_supervisor import ShardSupervisor
+        symbols = os.getenv('SHARD_SYMBOLS', 'DOGEUSDT,SHIBUSDT,PEPEUSDT,FLOKIUSDT,BONKUSDT').split(',')
+        supervisor = ShardSupervisor(symbols, num_workers=int(os.getenv('SHARD_WORKERS')), interval=300,
+                                     shm_name=os.getenv('MARKET_STATE_SHM', 'meme_market_state'))
+        supervisor.run()
     else:
         # 运行交易机器人
         asyncio.run(main())
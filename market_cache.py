@@ -0,0 +1,434 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# 各类数据的默认有效期（秒）
+DEFAULT_TTLS = {
+    'klines': 30,
+    'order_book': 2,
+    'ticker': 5,
+    'indicators': 30,
+    'signals': 60,
+    'social': 120
+}
+
+# 编码格式：1 字节版本 + 4 字节 JSON 头长度 + JSON 头 + 依次拼接的数组原始字节
+_FORMAT_PLAIN = b'\x01'
+_FORMAT_ZLIB = b'\x02'
+_HEADER = struct.Struct('>I')
+_COMPRESS_MIN = 1024
+
+# 领头调用被取消时交给等待者的标记，等待者据此重新发起加载
+_RETRY = object()
+
+
+def encode_value(value) -> bytes:
+    """编码缓存值，numpy 数组以原始字节存放，其余部分为 JSON"""
+    buffers = []
+
+    def replace(obj):
+        if isinstance(obj, np.ndarray):
+            array = np.ascontiguousarray(obj)
+            buffers.append(array.tobytes())
+            return {'__nd__': len(buffers) - 1, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        if isinstance(obj, dict):
+            return {key: replace(item) for key, item in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [replace(item) for item in obj]
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return obj
+
+    header = json.dumps(replace(value), separators=(',', ':'), default=str).encode()
+    body = _HEADER.pack(len(header)) + header + b''.join(buffers)
+    if len(body) >= _COMPRESS_MIN:
+        return _FORMAT_ZLIB + zlib.compress(body, 1)
+    return _FORMAT_PLAIN + body
+
+
+def decode_value(data: bytes):
+    """encode_value 的逆过程"""
+    body = zlib.decompress(data[1:]) if data[:1] == _FORMAT_ZLIB else data[1:]
+    (header_len,) = _HEADER.unpack_from(body)
+    offset = _HEADER.size + header_len
+    header = json.loads(body[_HEADER.size:offset])
+    view = memoryview(body)
+
+    def restore(obj):
+        nonlocal offset
+        if isinstance(obj, dict):
+            if '__nd__' in obj:
+                dtype = np.dtype(obj['dtype'])
+                count = int(np.prod(obj['shape'], dtype=np.int64))
+                array = np.frombuffer(view, dtype=dtype, count=count, offset=offset).reshape(obj['shape'])
+                offset += count * dtype.itemsize
+                return array
+            return {key: restore(item) for key, item in obj.items()}
+        if isinstance(obj, list):
+            return [restore(item) for item in obj]
+        return obj
+
+    return restore(header)
+
+
+class _LocalLRU:
+    """进程内带过期时间的 LRU"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MarketCache:
+    """两级行情/信号缓存
+
+    第一级是进程内 LRU，第二级是多个进程（机器人主循环、Flask worker、
+    分片 worker）共用的 Redis。未命中时同一进程内的并发请求只触发一次
+    上游获取，跨进程则用 Redis 短锁协调，其余进程等待结果写回。Redis
+    不可用时自动退化为仅进程内缓存，过一段时间再重试。
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: str = 'memebot', ttls: Optional[Dict[str, float]] = None,
+                 local_max_entries: int = 4096, local_ttl_cap: float = 5.0, lock_ttl: float = 10.0,
+                 poll_interval: float = 0.02, retry_interval: float = 30.0):
+        self.url = url
+        self.prefix = prefix
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.local = _LocalLRU(local_max_entries)
+        # 进程内副本的有效期不超过这个上限，避免跨进程看到的数据相差太久
+        self.local_ttl_cap = local_ttl_cap
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _key(self, key_type: str, key: str) -> str:
+        return f"{self.prefix}:{key_type}:{key}"
+
+    def _count(self, key_type: str, field: str):
+        stats = self.stats.setdefault(key_type, {'local_hits': 0, 'remote_hits': 0, 'misses': 0,
+                                                 'coalesced': 0, 'fetches': 0, 'errors': 0})
+        stats[field] += 1
+
+    def _client(self):
+        if not self.url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(self.url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def _remote_failed(self, e: Exception):
+        if self._redis_down_until <= time.monotonic():
+            logger.warning("共享缓存不可用，%.0fs 内仅使用进程内缓存: %s", self.retry_interval, e)
+        self._redis_down_until = time.monotonic() + self.retry_interval
+
+    async def _remote_get(self, full_key: str):
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            data = await client.get(full_key)
+        except (RedisError, OSError) as e:
+            self._remote_failed(e)
+            return None
+        return None if data is None else decode_value(data)
+
+    async def _remote_set(self, full_key: str, value, ttl: float):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            await client.set(full_key, encode_value(value), px=max(1, int(ttl * 1000)))
+        except (RedisError, OSError) as e:
+            self._remote_failed(e)
+
+    async def get(self, key_type: str, key: str):
+        """只读查询，两级都未命中返回 None"""
+        full_key = self._key(key_type, key)
+        entry = self.local.get(full_key)
+        if entry is not None:
+            self._count(key_type, 'local_hits')
+            return entry[1]
+        value = await self._remote_get(full_key)
+        if value is not None:
+            self._count(key_type, 'remote_hits')
+            self.local.set(full_key, value, min(self.ttls.get(key_type, 30), self.local_ttl_cap))
+            return value
+        self._count(key_type, 'misses')
+        return None
+
+    async def set(self, key_type: str, key: str, value, ttl: Optional[float] = None):
+        """写入两级缓存"""
+        ttl = ttl if ttl is not None else self.ttls.get(key_type, 30)
+        full_key = self._key(key_type, key)
+        self.local.set(full_key, value, min(ttl, self.local_ttl_cap))
+        await self._remote_set(full_key, value, ttl)
+
+    async def invalidate(self, key_type: str, key: str):
+        full_key = self._key(key_type, key)
+        self.local.delete(full_key)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.delete(full_key)
+            except (RedisError, OSError) as e:
+                self._remote_failed(e)
+
+    async def get_or_fetch(self, key_type: str, key: str, fetch: Callable[[], Awaitable],
+                           ttl: Optional[float] = None):
+        """读取缓存，未命中时调用 fetch 获取并写回
+
+        fetch 返回 None 视为获取失败，结果不缓存。
+        """
+        full_key = self._key(key_type, key)
+        entry = self.local.get(full_key)
+        if entry is not None:
+            self._count(key_type, 'local_hits')
+            return entry[1]
+
+        while True:
+            inflight = self._inflight.get(full_key)
+            if inflight is None:
+                break
+            value = await asyncio.shield(inflight)
+            if value is not _RETRY:
+                self._count(key_type, 'coalesced')
+                return value
+            # 领头的调用被取消，由等待者之一接手重新加载
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await self._load(key_type, full_key, fetch, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # 取消只属于发起取消的调用方，不传给合并进来的等待者
+            future.set_result(_RETRY)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时取走异常，避免 “Future exception was never retrieved”
+            future.exception()
+            raise
+        finally:
+            del self._inflight[full_key]
+
+    async def _load(self, key_type: str, full_key: str, fetch: Callable[[], Awaitable], ttl: Optional[float]):
+        ttl = ttl if ttl is not None else self.ttls.get(key_type, 30)
+        local_ttl = min(ttl, self.local_ttl_cap)
+
+        value = await self._remote_get(full_key)
+        if value is not None:
+            self._count(key_type, 'remote_hits')
+            self.local.set(full_key, value, local_ttl)
+            return value
+
+        # 跨进程单飞：抢到锁的进程去获取，其余进程轮询等待结果。持锁进程
+        # 获取失败时不会写回，锁一消失就重新抢锁，不必等满 lock_ttl
+        lock_key = f"{full_key}:lock"
+        token = uuid.uuid4().hex
+        client = self._client()
+        locked = False
+        deadline = time.monotonic() + self.lock_ttl
+        while client is not None and not locked and time.monotonic() < deadline:
+            try:
+                locked = bool(await client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)))
+                while not locked and time.monotonic() < deadline:
+                    await asyncio.sleep(self.poll_interval)
+                    data, holder = await client.mget(full_key, lock_key)
+                    if data is not None:
+                        self._count(key_type, 'coalesced')
+                        value = decode_value(data)
+                        self.local.set(full_key, value, local_ttl)
+                        return value
+                    if holder is None:
+                        break
+            except (RedisError, OSError) as e:
+                self._remote_failed(e)
+                break
+
+        self._count(key_type, 'misses')
+        try:
+            self._count(key_type, 'fetches')
+            try:
+                value = await fetch()
+            except Exception:
+                self._count(key_type, 'errors')
+                raise
+            if value is not None:
+                self.local.set(full_key, value, local_ttl)
+                await self._remote_set(full_key, value, ttl)
+            return value
+        finally:
+            if locked:
+                try:
+                    if await client.get(lock_key) == token.encode():
+                        await client.delete(lock_key)
+                except (RedisError, OSError) as e:
+                    self._remote_failed(e)
+
+    def get_stats(self) -> Dict:
+        """各类数据的命中情况，合并到他人获取结果的请求也算命中"""
+        result = {}
+        for key_type, stats in self.stats.items():
+            hits = stats['local_hits'] + stats['remote_hits'] + stats['coalesced']
+            lookups = hits + stats['misses']
+            result[key_type] = {**stats, 'hit_rate': round(hits / lookups, 4) if lookups else None}
+        result['local_entries'] = len(self.local)
+        result['remote'] = 'disabled' if not self.url else (
+            'down' if time.monotonic() < self._redis_down_until else 'up')
+        return result
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+# 全局缓存实例，未配置 REDIS_URL 时只有进程内一级
+cache = MarketCache(os.getenv('REDIS_URL'))
+
+
+async def run_redis_stub():
+    """启动本地 Redis 协议桩，支持 PING/GET/MGET/SET(EX/PX/NX)/DEL"""
+    store: Dict[bytes, tuple] = {}
+
+    def lookup(key: bytes):
+        entry = store.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del store[key]
+            return None
+        return entry
+
+    def execute(args):
+        command = args[0].upper()
+        if command == b'PING':
+            return b'+PONG\r\n'
+        if command == b'GET':
+            entry = lookup(args[1])
+            return b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0])
+        if command == b'SET':
+            key, value, options = args[1], args[2], [arg.upper() for arg in args[3:]]
+            expires = None
+            if b'PX' in options:
+                expires = time.monotonic() + int(args[3 + options.index(b'PX') + 1]) / 1000
+            elif b'EX' in options:
+                expires = time.monotonic() + int(args[3 + options.index(b'EX') + 1])
+            if b'NX' in options and lookup(key) is not None:
+                return b'$-1\r\n'
+            store[key] = (value, expires)
+            return b'+OK\r\n'
+        if command == b'MGET':
+            values = [lookup(key) for key in args[1:]]
+            return b'*%d\r\n' % len(values) + b''.join(
+                b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0]) for entry in values)
+        if command == b'DEL':
+            removed = sum(store.pop(key, None) is not None for key in args[1:])
+            return b':%d\r\n' % removed
+        if command in (b'CLIENT', b'SELECT'):
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                count = int(line[1:])
+                args = []
+                for _ in range(count):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    return server, f"redis://{host}:{port}/0", store
+
+
+async def main():
+    server, url, store = await run_redis_stub()
+    upstream_calls = 0
+
+    async def fetch_klines():
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.05)
+        return np.random.default_rng(upstream_calls).random((500, 12))
+
+    # Example usage: three "processes" (separate cache instances) share one Redis stand-in
+    workers = [MarketCache(url) for _ in range(3)]
+    started = time.perf_counter()
+    for _ in range(20):
+        results = await asyncio.gather(*(
+            worker.get_or_fetch('klines', 'binance:DOGEUSDT:1m', fetch_klines)
+            for worker in workers for _ in range(50)
+        ))
+    elapsed = time.perf_counter() - started
+    assert all(np.array_equal(results[0], result) for result in results)
+    print(f"3000 concurrent reads in {elapsed:.2f}s, upstream fetches: {upstream_calls}")
+
+    encoded = encode_value(results[0])
+    as_json = json.dumps(results[0].tolist()).encode()
+    print(f"Encoded 500x12 klines: {len(encoded)} bytes (JSON: {len(as_json)} bytes)")
+    for index, worker in enumerate(workers):
+        print(f"worker {index}: {worker.get_stats()}")
+
+    # Redis going away degrades to the local tier instead of failing
+    server.close()
+    await server.wait_closed()
+    fallback = MarketCache(url, retry_interval=5)
+    await fallback.get_or_fetch('ticker', 'DOGEUSDT', lambda: asyncio.sleep(0, result={'price': 0.1}))
+    print(f"fallback: {await fallback.get('ticker', 'DOGEUSDT')} {fallback.get_stats()['remote']}")
+
+    for worker in workers + [fallback]:
+        await worker.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,29 @@
 import asyncio
 import aiohttp
 import json
+import logging
 import time
 
+import numpy as np
+
+from market_cache import cache as shared_cache
+from rate_governor import governor, binance_depth_weight, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
 class MarketDataCollector:
-    def __init__(self, exchange_api_keys):
+    def __init__(self, exchange_api_keys, cache=None):
         self.exchange_api_keys = exchange_api_keys
+        # Klines and books are shared through the two-level cache so the bot loop,
+        # shard workers and API workers don't each hit the exchange for the same data
+        self.cache = cache or shared_cache
         self.base_urls = {
             "binance": "https://api.binance.com/api/v3",
             "coinbase": "https://api.coinbase.com/v2",
             # Add other exchanges as needed
         }
 
-    async def fetch_klines(self, exchange, symbol, interval, limit):
+    async def fetch_klines(self, exchange, symbol, interval, limit, priority=PRIORITY_NORMAL):
         url = ""
         headers = {}
         if exchange == "binance":
@@ -20,48 +31,65 @@ class MarketDataCollector:
         elif exchange == "coinbase":
             # Coinbase API for klines is more complex, often requires authentication and specific product_id
             # This is a simplified example, actual implementation would need more details
-            print(f"Warning: Coinbase klines fetching is not fully implemented in this example.")
+            logger.warning("Coinbase klines fetching is not fully implemented in this example.")
             return []
         else:
-            print(f"Error: Unsupported exchange {exchange}")
+            logger.error("Unsupported exchange %s", exchange)
             return []
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=headers) as response:
-                    response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-                    data = await response.json()
-                    return data
-            except aiohttp.ClientError as e:
-                print(f"Error fetching klines from {exchange}: {e}")
-                return []
-
-    async def fetch_order_book(self, exchange, symbol, limit):
+        async def fetch():
+            async with aiohttp.ClientSession() as session:
+                try:
+                    async with governor.request(session, "GET", url, "binance", weight=2, priority=priority,
+                                                headers=headers) as response:
+                        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+                        data = await response.json()
+                        return np.array(data, dtype=np.float64).reshape(len(data), 12)
+                except aiohttp.ClientError as e:
+                    logger.error("Error fetching klines from %s: %s", exchange, e)
+                    return None
+
+        klines = await self.cache.get_or_fetch("klines", f"{exchange}:{symbol}:{interval}:{limit}", fetch)
+        return [] if klines is None else klines.tolist()
+
+    async def fetch_order_book(self, exchange, symbol, limit, priority=PRIORITY_NORMAL):
         url = ""
         headers = {}
         if exchange == "binance":
             url = f"{self.base_urls['binance']}/depth?symbol={symbol}&limit={limit}"
         elif exchange == "coinbase":
-            print(f"Warning: Coinbase order book fetching is not fully implemented in this example.")
+            logger.warning("Coinbase order book fetching is not fully implemented in this example.")
             return {}
         else:
-            print(f"Error: Unsupported exchange {exchange}")
+            logger.error("Unsupported exchange %s", exchange)
+            return {}
+
+        async def fetch():
+            async with aiohttp.ClientSession() as session:
+                try:
+                    async with governor.request(session, "GET", url, "binance", weight=binance_depth_weight(limit),
+                                                priority=priority, headers=headers) as response:
+                        response.raise_for_status()
+                        data = await response.json()
+                        return {
+                            "lastUpdateId": data.get("lastUpdateId"),
+                            "bids": np.array(data.get("bids", []), dtype=np.float64).reshape(-1, 2),
+                            "asks": np.array(data.get("asks", []), dtype=np.float64).reshape(-1, 2)
+                        }
+                except aiohttp.ClientError as e:
+                    logger.error("Error fetching order book from %s: %s", exchange, e)
+                    return None
+
+        book = await self.cache.get_or_fetch("order_book", f"{exchange}:{symbol}:{limit}", fetch)
+        if book is None:
             return {}
+        return {"lastUpdateId": book["lastUpdateId"], "bids": book["bids"].tolist(), "asks": book["asks"].tolist()}
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=headers) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    return data
-            except aiohttp.ClientError as e:
-                print(f"Error fetching order book from {exchange}: {e}")
-                return {}
-
-    async def collect_market_data(self, exchange, symbol, kline_interval='1m', kline_limit=100, order_book_limit=100):
-        print(f"Collecting market data for {symbol} on {exchange}...")
-        klines = await self.fetch_klines(exchange, symbol, kline_interval, kline_limit)
-        order_book = await self.fetch_order_book(exchange, symbol, order_book_limit)
+    async def collect_market_data(self, exchange, symbol, kline_interval='1m', kline_limit=100, order_book_limit=100,
+                                  priority=PRIORITY_NORMAL):
+        logger.debug("Collecting market data for %s on %s...", symbol, exchange)
+        klines = await self.fetch_klines(exchange, symbol, kline_interval, kline_limit, priority)
+        order_book = await self.fetch_order_book(exchange, symbol, order_book_limit, priority)
 
         market_data = {
             "timestamp": int(time.time() * 1000), # Milliseconds
@@ -70,7 +98,7 @@ class MarketDataCollector:
             "klines": klines,
             "order_book": order_book
         }
-        print(f"Collected data for {symbol} on {exchange}.")
+        logger.debug("Collected data for %s on %s.", symbol, exchange)
         return market_data
 
 async def main():
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# 消息优先级，数值越小越先发送
+PRIORITY_TRADE = 0
+PRIORITY_ALERT = 1
+PRIORITY_DIGEST = 2
+
+# Telegram 单条消息上限
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """令牌桶限速"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationQueue:
+    """后台 Telegram 通知管道
+
+    热路径只把消息放入有界优先队列后立即返回。交易成交等高优先级消息
+    优先发送；周期汇总先缓存在摘要缓冲区，按时间窗口合并成一条摘要。
+    发送端使用令牌桶限速，遇到 429 按 retry_after 重试，重复消息在去重
+    窗口内直接丢弃（成交消息不去重，每笔成交都要送达）。
+    """
+
+    def __init__(self, bot_token: str, chat_id: str, base_url: str = "https://api.telegram.org",
+                 max_size: int = 1000, rate_per_second: float = 1.0, burst: int = 3,
+                 digest_window: float = 60.0, dedup_window: float = 300.0, max_retries: int = 3,
+                 max_digest_lines: int = 1000):
+        self.url = f"{base_url.rstrip('/')}/bot{bot_token}/sendMessage"
+        self.chat_id = chat_id
+        self.digest_window = digest_window
+        self.dedup_window = dedup_window
+        self.max_retries = max_retries
+        self.max_digest_lines = max_digest_lines
+        self._queue = asyncio.PriorityQueue(maxsize=max_size)
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self._sequence = itertools.count()
+        self._digest_buffer: deque = deque()
+        self._recent: Dict[str, float] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'failed': 0,
+            'dropped': 0,
+            'deduplicated': 0,
+            'coalesced': 0,
+            'retries': 0
+        }
+
+    async def start(self):
+        """启动后台发送和摘要合并任务"""
+        if self._tasks:
+            return
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self._tasks = [
+            asyncio.create_task(self._send_loop()),
+            asyncio.create_task(self._digest_loop())
+        ]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """合并剩余摘要、尽量发送完队列后停止"""
+        self._flush_digest()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("通知队列未在 %ss 内发送完，剩余 %d 条", drain_timeout, self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def publish(self, text: str, priority: int = PRIORITY_ALERT) -> bool:
+        """非阻塞发布一条消息，返回是否被接受"""
+        if priority != PRIORITY_TRADE and self._is_duplicate(text):
+            self.stats['deduplicated'] += 1
+            return False
+        if priority == PRIORITY_DIGEST:
+            if len(self._digest_buffer) >= self.max_digest_lines:
+                # 摘要缓冲区与队列一样有界，满了丢弃最旧的一条
+                self._digest_buffer.popleft()
+                self.stats['dropped'] += 1
+            self._digest_buffer.append(text)
+            return True
+        return self._enqueue(priority, text)
+
+    def _enqueue(self, priority: int, text: str) -> bool:
+        try:
+            self._queue.put_nowait((priority, next(self._sequence), text))
+            self.stats['queued'] += 1
+            return True
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.warning("通知队列已满，丢弃消息: %.50s", text)
+            return False
+
+    def _is_duplicate(self, text: str) -> bool:
+        now = time.monotonic()
+        key = hashlib.sha1(text.encode()).hexdigest()
+        if len(self._recent) > 10000:
+            self._recent = {k: t for k, t in self._recent.items() if now - t < self.dedup_window}
+        seen = self._recent.get(key)
+        if seen is not None and now - seen < self.dedup_window:
+            return True
+        self._recent[key] = now
+        return False
+
+    def _flush_digest(self):
+        if not self._digest_buffer:
+            return
+        lines, self._digest_buffer = list(self._digest_buffer), deque()
+        if len(lines) > 1:
+            self.stats['coalesced'] += len(lines) - 1
+
+        # 按 Telegram 单条上限切分成多条，每条预留标题的长度
+        reserve = 40
+        chunks, current, size = [], [], 0
+        for line in lines:
+            line = line[:MAX_MESSAGE_LENGTH - reserve]
+            if current and size + len(line) + 1 > MAX_MESSAGE_LENGTH - reserve:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        chunks.append(current)
+
+        for part, chunk in enumerate(chunks, 1):
+            suffix = f" {part}/{len(chunks)}" if len(chunks) > 1 else ""
+            header = f"周期汇总 ({len(lines)} 条){suffix}"
+            self._enqueue(PRIORITY_DIGEST, "\n".join([header] + chunk))
+
+    async def _digest_loop(self):
+        while True:
+            await asyncio.sleep(self.digest_window)
+            self._flush_digest()
+
+    async def _send_loop(self):
+        while True:
+            priority, _, text = await self._queue.get()
+            try:
+                await self._deliver(text)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error("发送通知失败: %s", e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, text: str):
+        payload = {'chat_id': self.chat_id, 'text': text}
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                async with self._session.post(self.url, json=payload) as response:
+                    if response.status == 429:
+                        data = await response.json(content_type=None)
+                        retry_after = data.get('parameters', {}).get('retry_after') \
+                            or float(response.headers.get('Retry-After', 1))
+                        self.stats['retries'] += 1
+                        await asyncio.sleep(retry_after)
+                        continue
+                    if response.status >= 500:
+                        self.stats['retries'] += 1
+                        await asyncio.sleep(2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    self.stats['sent'] += 1
+                    return
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self.stats['retries'] += 1
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f"重试 {self.max_retries} 次后仍未发送成功")
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'pending': self._queue.qsize(), 'digest_buffered': len(self._digest_buffer)}
+
+
+async def run_telegram_stub(min_interval: float = 0.1):
+    """启动本地 Telegram 桩服务，发送过快时返回 429"""
+    from aiohttp import web
+
+    received = []
+    last_accepted = [0.0]
+
+    async def send_message(request):
+        now = time.monotonic()
+        if now - last_accepted[0] < min_interval:
+            return web.json_response({'ok': False, 'error_code': 429, 'parameters': {'retry_after': min_interval}},
+                                     status=429)
+        last_accepted[0] = now
+        received.append((await request.json())['text'])
+        return web.json_response({'ok': True})
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/sendMessage', send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", received
+
+
+async def main():
+    runner, base_url, received = await run_telegram_stub(min_interval=0.1)
+    notifier = NotificationQueue("MOCK_TOKEN", "MOCK_CHAT", base_url=base_url,
+                                 rate_per_second=20, burst=5, digest_window=0.5)
+    await notifier.start()
+
+    # Example usage: many cycle summaries, a few trade fills and a duplicate alert
+    for i in range(200):
+        notifier.publish(f"Bot cycle completed for COIN{i}USDT.", priority=PRIORITY_DIGEST)
+    for coin in ["DOGEUSDT", "PEPEUSDT"]:
+        notifier.publish(f"Trade filled: BUY {coin}", priority=PRIORITY_TRADE)
+    for _ in range(2):
+        notifier.publish("Drawdown limit reached", priority=PRIORITY_ALERT)
+
+    await asyncio.sleep(1)
+    await notifier.stop()
+    await runner.cleanup()
+
+    print("\nNotifier Stats:")
+    print(notifier.get_stats())
+    print(f"Stub received {len(received)} messages, lengths: {[len(text) for text in received]}")
+    print(f"All summaries delivered: {sum(text.count('Bot cycle completed') for text in received) == 200}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,412 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+import aiohttp
+
+from rate_governor import governor as shared_governor, PRIORITY_CRITICAL
+
+logger = logging.getLogger(__name__)
+
+# 订单状态
+ORDER_NEW = 'NEW'
+ORDER_SENDING = 'SENDING'
+ORDER_ACKNOWLEDGED = 'ACKNOWLEDGED'
+ORDER_PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+ORDER_FILLED = 'FILLED'
+ORDER_CANCELED = 'CANCELED'
+ORDER_REJECTED = 'REJECTED'
+
+# 允许的状态迁移
+ORDER_TRANSITIONS = {
+    ORDER_NEW: {ORDER_SENDING, ORDER_REJECTED},
+    ORDER_SENDING: {ORDER_ACKNOWLEDGED, ORDER_PARTIALLY_FILLED, ORDER_FILLED, ORDER_CANCELED, ORDER_REJECTED},
+    ORDER_ACKNOWLEDGED: {ORDER_PARTIALLY_FILLED, ORDER_FILLED, ORDER_CANCELED},
+    ORDER_PARTIALLY_FILLED: {ORDER_PARTIALLY_FILLED, ORDER_FILLED, ORDER_CANCELED},
+    ORDER_FILLED: set(),
+    ORDER_CANCELED: set(),
+    ORDER_REJECTED: set()
+}
+
+# 交易所订单状态到本地状态的映射
+EXCHANGE_STATUS_MAP = {
+    'NEW': ORDER_ACKNOWLEDGED,
+    'PARTIALLY_FILLED': ORDER_PARTIALLY_FILLED,
+    'FILLED': ORDER_FILLED,
+    'CANCELED': ORDER_CANCELED,
+    'EXPIRED': ORDER_CANCELED,
+    'REJECTED': ORDER_REJECTED
+}
+
+
+class Order:
+    """单个订单及其状态迁移记录"""
+
+    def __init__(self, symbol: str, side: str, quantity: float, order_type: str = 'MARKET',
+                 price: Optional[float] = None):
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.order_type = order_type
+        self.price = price
+        self.client_order_id = uuid.uuid4().hex[:24]
+        self.exchange_order_id = None
+        self.state = ORDER_NEW
+        self.history = [(ORDER_NEW, time.time())]
+        self.filled_quantity = 0.0
+        self.avg_fill_price = 0.0
+        self.fee = 0.0
+        self.latency_ms = None
+        self.error = None
+
+    def transition(self, new_state: str):
+        """迁移到新状态，非法迁移抛出 ValueError"""
+        if new_state not in ORDER_TRANSITIONS[self.state]:
+            raise ValueError(f"订单 {self.client_order_id} 非法状态迁移: {self.state} -> {new_state}")
+        self.state = new_state
+        self.history.append((new_state, time.time()))
+
+    @property
+    def is_done(self) -> bool:
+        return not ORDER_TRANSITIONS[self.state]
+
+    def to_dict(self) -> Dict:
+        return {
+            'client_order_id': self.client_order_id,
+            'exchange_order_id': self.exchange_order_id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'quantity': self.quantity,
+            'state': self.state,
+            'filled_quantity': self.filled_quantity,
+            'avg_fill_price': self.avg_fill_price,
+            'fee': self.fee,
+            'latency_ms': self.latency_ms,
+            'error': self.error
+        }
+
+
+class ExecutionEngine:
+    """低延迟订单执行引擎
+
+    持有一个预热的连接池会话，签名器的 HMAC 密钥状态预先计算好，每次下单
+    只需复制后追加查询串。相互独立的订单可并发提交，每笔订单记录发送到
+    交易所确认的延迟。确认时未成交的挂单通过 query_order 或 apply_report
+    继续推进到成交或撤销。
+    """
+
+    def __init__(self, api_key: str, secret_key: str, base_url: str = "https://api.binance.com",
+                 max_connections: int = 20, recv_window: int = 5000, timeout: float = 10.0,
+                 governor=None, upstream: str = 'binance'):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.recv_window = recv_window
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.governor = governor or shared_governor
+        self.upstream = upstream
+        self._headers = {'X-MBX-APIKEY': api_key or ''}
+        self._signer = hmac.new((secret_key or '').encode(), digestmod=hashlib.sha256)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+        self._time_offset_ms = 0
+        self.orders: Dict[str, Order] = {}
+        self.latencies = deque(maxlen=10000)
+
+    async def start(self):
+        """建立连接池并预热连接，同时校准服务器时间"""
+        async with self._session_lock:
+            if self._session and not self._session.closed:
+                return
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self._headers, timeout=self.timeout)
+
+        try:
+            async with self.governor.request(self._session, 'GET', f"{self.base_url}/api/v3/time", self.upstream,
+                                             priority=PRIORITY_CRITICAL) as response:
+                response.raise_for_status()
+                data = await response.json()
+                self._time_offset_ms = data['serverTime'] - int(time.time() * 1000)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+            logger.warning("执行会话预热失败: %s", e)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _sign(self, params: Dict) -> str:
+        """生成带签名的查询串"""
+        query = urlencode(params)
+        signer = self._signer.copy()
+        signer.update(query.encode())
+        return f"{query}&signature={signer.hexdigest()}"
+
+    async def submit_order(self, order: Order) -> Order:
+        """提交单个订单并根据交易所响应推进状态"""
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        self.orders[order.client_order_id] = order
+        params = {
+            'symbol': order.symbol,
+            'side': order.side,
+            'type': order.order_type,
+            'quantity': order.quantity,
+            'newClientOrderId': order.client_order_id,
+            'newOrderRespType': 'FULL',
+            'recvWindow': self.recv_window
+        }
+        if order.order_type == 'LIMIT':
+            params['price'] = order.price
+            params['timeInForce'] = 'GTC'
+
+        order.transition(ORDER_SENDING)
+        # 时间戳和签名在限流器放行之后生成，排队时间不会挤占 recvWindow
+        sent_at = await self.governor.acquire(self.upstream, weight=1, priority=PRIORITY_CRITICAL)
+        status, headers, body = None, None, b''
+        try:
+            params['timestamp'] = int(time.time() * 1000) + self._time_offset_ms
+            started = time.perf_counter()
+            async with self._session.post(f"{self.base_url}/api/v3/order?{self._sign(params)}") as response:
+                status, headers = response.status, response.headers
+                body = await response.read()
+                order.latency_ms = (time.perf_counter() - started) * 1000
+                self.latencies.append(order.latency_ms)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            order.error = str(e) or type(e).__name__
+            order.transition(ORDER_REJECTED)
+        finally:
+            self.governor.release(self.upstream, status, headers, sent_at)
+
+        if order.state == ORDER_SENDING:
+            # 代理错误页等非 JSON 响应同样按拒绝处理，不能让订单停在发送中
+            data = self._parse_body(body)
+            if status >= 400 or data is None:
+                order.error = data.get('msg', f"HTTP {status}") if data is not None else f"HTTP {status} 非 JSON 响应"
+                order.transition(ORDER_REJECTED)
+            else:
+                try:
+                    self._apply_exchange_report(order, data)
+                except ValueError as e:
+                    order.error = f"无法解析的成交回报: {e}"
+                    if order.state == ORDER_SENDING:
+                        order.transition(ORDER_REJECTED)
+
+        if order.state == ORDER_REJECTED:
+            logger.warning("订单被拒绝: %s %s %s", order.symbol, order.side, order.error)
+        return order
+
+    @staticmethod
+    def _parse_body(body: bytes) -> Optional[Dict]:
+        """解析交易所响应体，非 JSON 对象返回 None"""
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def submit_orders(self, orders: List[Order]) -> List[Order]:
+        """并发提交多个相互独立的订单"""
+        return list(await asyncio.gather(*(self.submit_order(order) for order in orders)))
+
+    def _apply_exchange_report(self, order: Order, data: Dict):
+        order.exchange_order_id = data.get('orderId', order.exchange_order_id)
+        filled = float(data.get('executedQty', order.filled_quantity))
+        quote = float(data.get('cummulativeQuoteQty', order.avg_fill_price * order.filled_quantity))
+        new_state = EXCHANGE_STATUS_MAP.get(data.get('status'), ORDER_ACKNOWLEDGED)
+        if new_state == ORDER_ACKNOWLEDGED and order.state != ORDER_SENDING:
+            # 挂单仍未成交，重复的 NEW 回报不是状态迁移
+            new_state = order.state
+        order.filled_quantity = filled
+        order.avg_fill_price = quote / filled if filled else 0.0
+        if 'fills' in data:
+            order.fee = sum(float(fill.get('commission', 0)) for fill in data['fills'])
+        if new_state != order.state or new_state == ORDER_PARTIALLY_FILLED:
+            order.transition(new_state)
+
+    def apply_report(self, client_order_id: str, data: Dict) -> Optional[Order]:
+        """应用一条执行回报（用户数据流或订单查询结果），推进挂单的状态
+
+        回报字段与下单响应一致；未知订单或已结束的订单忽略并返回 None。
+        """
+        order = self.orders.get(client_order_id)
+        if order is None or order.is_done:
+            return None
+        try:
+            self._apply_exchange_report(order, data)
+        except ValueError as e:
+            logger.warning("忽略无法应用的执行回报 %s: %s", client_order_id, e)
+            return None
+        return order
+
+    async def query_order(self, order: Order) -> Order:
+        """向交易所查询挂单状态，用于推进 LIMIT 等未在确认时成交的订单"""
+        if order.is_done:
+            return order
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        sent_at = await self.governor.acquire(self.upstream, weight=4, priority=PRIORITY_CRITICAL)
+        status, headers, body = None, None, b''
+        try:
+            params = {
+                'symbol': order.symbol,
+                'origClientOrderId': order.client_order_id,
+                'recvWindow': self.recv_window,
+                'timestamp': int(time.time() * 1000) + self._time_offset_ms
+            }
+            async with self._session.get(f"{self.base_url}/api/v3/order?{self._sign(params)}") as response:
+                status, headers = response.status, response.headers
+                body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("订单查询失败 %s: %s", order.client_order_id, e)
+            return order
+        finally:
+            self.governor.release(self.upstream, status, headers, sent_at)
+
+        data = self._parse_body(body)
+        if status >= 400 or data is None:
+            logger.warning("订单查询失败 %s: HTTP %s", order.client_order_id, status)
+            return order
+        self.apply_report(order.client_order_id, data)
+        return order
+
+    async def query_open_orders(self) -> List[Order]:
+        """查询所有未结束的订单，返回本次状态有变化的订单"""
+        pending = [order for order in self.orders.values() if not order.is_done]
+        before = {order.client_order_id: (order.state, order.filled_quantity) for order in pending}
+        await asyncio.gather(*(self.query_order(order) for order in pending))
+        return [order for order in pending
+                if (order.state, order.filled_quantity) != before[order.client_order_id]]
+
+    async def execute_instruction(self, symbol: str, instruction: Dict) -> Dict:
+        """执行一条交易指令，返回与旧执行器兼容的结果"""
+        order = Order(symbol, instruction['action'], instruction.get('amount', 0.001))
+        await self.submit_order(order)
+        executed = order.state in (ORDER_FILLED, ORDER_PARTIALLY_FILLED)
+        return {
+            'status': 'EXECUTED' if executed else 'FAILED',
+            'order_id': order.exchange_order_id,
+            'price': order.avg_fill_price,
+            'amount': order.filled_quantity,
+            'fee': order.fee,
+            'latency_ms': order.latency_ms,
+            'error': order.error
+        }
+
+    def get_latency_stats(self) -> Dict:
+        """获取下单延迟统计（毫秒）"""
+        if not self.latencies:
+            return {'count': 0, 'p50': None, 'p99': None, 'max': None}
+        samples = sorted(self.latencies)
+        return {
+            'count': len(samples),
+            'p50': samples[int(0.50 * (len(samples) - 1))],
+            'p99': samples[int(0.99 * (len(samples) - 1))],
+            'max': samples[-1]
+        }
+
+
+async def run_mock_exchange(secret_key: str):
+    """启动本地模拟交易所，校验签名；市价单立即成交，限价单挂单后在查询时成交"""
+    from aiohttp import web
+
+    resting: Dict[str, Dict] = {}
+
+    def verified(request) -> bool:
+        payload, _, signature = request.query_string.rpartition('&signature=')
+        expected = hmac.new(secret_key.encode(), payload.encode(), hashlib.sha256).hexdigest()
+        return signature == expected
+
+    def filled_report(order_id: int, client_order_id: str, quantity: float, price: float) -> Dict:
+        return {
+            'orderId': order_id,
+            'clientOrderId': client_order_id,
+            'status': 'FILLED',
+            'executedQty': str(quantity),
+            'cummulativeQuoteQty': str(quantity * price),
+            'fills': [{'price': str(price), 'qty': str(quantity), 'commission': str(quantity * price * 0.001)}]
+        }
+
+    async def server_time(request):
+        return web.json_response({'serverTime': int(time.time() * 1000)})
+
+    async def new_order(request):
+        if request.query['symbol'] == 'GATEWAYUSDT':
+            # 模拟前置代理返回的 HTML 错误页
+            return web.Response(text='<html><body>502 Bad Gateway</body></html>', status=502,
+                                content_type='text/html')
+        if not verified(request):
+            return web.json_response({'code': -1022, 'msg': 'Signature for this request is not valid.'}, status=400)
+        client_order_id = request.query['newClientOrderId']
+        quantity = float(request.query['quantity'])
+        order_id = int(time.time() * 1e6)
+        if request.query['type'] == 'LIMIT':
+            resting[client_order_id] = {'orderId': order_id, 'quantity': quantity,
+                                        'price': float(request.query['price'])}
+            return web.json_response({'orderId': order_id, 'clientOrderId': client_order_id, 'status': 'NEW',
+                                      'executedQty': '0', 'cummulativeQuoteQty': '0', 'fills': []})
+        return web.json_response(filled_report(order_id, client_order_id, quantity, 0.1))
+
+    async def query_order(request):
+        if not verified(request):
+            return web.json_response({'code': -1022, 'msg': 'Signature for this request is not valid.'}, status=400)
+        client_order_id = request.query['origClientOrderId']
+        order = resting.get(client_order_id)
+        if order is None:
+            return web.json_response({'code': -2013, 'msg': 'Order does not exist.'}, status=400)
+        report = filled_report(order['orderId'], client_order_id, order['quantity'], order['price'])
+        del report['fills']
+        return web.json_response(report)
+
+    app = web.Application()
+    app.router.add_get('/api/v3/time', server_time)
+    app.router.add_post('/api/v3/order', new_order)
+    app.router.add_get('/api/v3/order', query_order)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def main():
+    secret_key = "MOCK_SECRET_KEY"
+    runner, base_url = await run_mock_exchange(secret_key)
+    engine = ExecutionEngine("MOCK_API_KEY", secret_key, base_url=base_url)
+    await engine.start()
+
+    # Example usage: submit batches of independent orders concurrently
+    for _ in range(50):
+        orders = [Order(symbol, "BUY", 1000) for symbol in ["DOGEUSDT", "SHIBUSDT", "PEPEUSDT", "FLOKIUSDT"]]
+        await engine.submit_orders(orders)
+
+    print("\nLast Order:")
+    print(orders[-1].to_dict())
+    print("\nSubmit Latency (ms):")
+    print(engine.get_latency_stats())
+
+    # A proxy error page is rejected instead of leaving the order in SENDING
+    bad_gateway = await engine.submit_order(Order("GATEWAYUSDT", "BUY", 1000))
+    print("\nBad gateway:", bad_gateway.state, bad_gateway.error)
+
+    # LIMIT orders rest after the ack and are advanced to FILLED by a status query
+    limit_orders = await engine.submit_orders([Order("DOGEUSDT", "BUY", 1000, 'LIMIT', 0.09),
+                                               Order("PEPEUSDT", "SELL", 500, 'LIMIT', 0.11)])
+    print("After ack:", [order.state for order in limit_orders])
+    updated = await engine.query_open_orders()
+    print("After query:", [(order.state, order.filled_quantity, order.avg_fill_price) for order in updated])
+
+    await engine.close()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
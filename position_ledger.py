@@ -0,0 +1,256 @@
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 平仓后剩余数量相对成交规模小于该比例时视为浮点误差，归零
+QUANTITY_EPSILON = 1e-9
+
+
+class PositionLedger:
+    """内存持仓与盈亏账本
+
+    每个交易对占用一行，数量、平均成本、已实现盈亏、手续费和最新价格
+    分别存放在连续的 numpy 数组中。成交时按下标 O(1) 更新，价格更新时
+    对所有持仓一次性向量化盯市，敞口和回撤汇总值可随时读取。
+    """
+
+    def __init__(self, initial_capital: float = 10000.0, capacity: int = 64,
+                 max_position_value: float = 2000.0, max_total_exposure: float = 8000.0,
+                 max_drawdown_pct: float = 20.0):
+        self.initial_capital = initial_capital
+        self.max_position_value = max_position_value
+        self.max_total_exposure = max_total_exposure
+        self.max_drawdown_pct = max_drawdown_pct
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._allocate(capacity)
+
+        # 汇总值在成交和盯市时维护，查询时无需重新计算
+        self._unrealized = 0.0
+        self._exposure = 0.0
+        self._peak_equity = initial_capital
+        self._max_drawdown = 0.0
+
+    def _allocate(self, capacity: int):
+        """分配（或扩容）数组存储"""
+        old_size = len(self._symbols)
+        arrays = {}
+        for name in ('quantity', 'avg_cost', 'realized_pnl', 'fees', 'last_price'):
+            new_array = np.zeros(capacity, dtype=np.float64)
+            if old_size:
+                new_array[:old_size] = getattr(self, name)[:old_size]
+            arrays[name] = new_array
+        self.quantity = arrays['quantity']
+        self.avg_cost = arrays['avg_cost']
+        self.realized_pnl = arrays['realized_pnl']
+        self.fees = arrays['fees']
+        self.last_price = arrays['last_price']
+        self._capacity = capacity
+
+    def _slot(self, symbol: str) -> int:
+        """获取交易对所在行，不存在时新建"""
+        idx = self._index.get(symbol)
+        if idx is None:
+            if len(self._symbols) == self._capacity:
+                self._allocate(self._capacity * 2)
+            idx = len(self._symbols)
+            self._index[symbol] = idx
+            self._symbols.append(symbol)
+        return idx
+
+    def apply_fill(self, symbol: str, amount: float, price: float, is_buy: bool, fee: float = 0.0) -> Dict:
+        """记录一笔成交，返回该交易对更新后的持仓"""
+        if amount <= 0 or price <= 0:
+            raise ValueError(f"无效成交: amount={amount}, price={price}")
+
+        with self._lock:
+            idx = self._slot(symbol)
+            qty = float(self.quantity[idx])
+            avg = float(self.avg_cost[idx])
+            delta = amount if is_buy else -amount
+
+            if qty == 0 or (qty > 0) == (delta > 0):
+                # 开仓或加仓：更新加权平均成本
+                new_qty = qty + delta
+                self.avg_cost[idx] = (qty * avg + delta * price) / new_qty
+            else:
+                # 减仓、平仓或反手：按平均成本结算已实现盈亏
+                new_qty = qty + delta
+                if abs(new_qty) <= QUANTITY_EPSILON * max(abs(qty), amount):
+                    new_qty = 0.0
+                closed = abs(qty) if new_qty == 0 else min(abs(delta), abs(qty))
+                self.realized_pnl[idx] += closed * (price - avg) * (1 if qty > 0 else -1)
+                if new_qty == 0:
+                    self.avg_cost[idx] = 0.0
+                elif (new_qty > 0) != (qty > 0):
+                    self.avg_cost[idx] = price
+
+            self.quantity[idx] = new_qty
+            self.fees[idx] += fee
+
+            # 增量维护该行对汇总值的贡献
+            old_mark = float(self.last_price[idx]) or avg
+            self._unrealized -= qty * (old_mark - avg)
+            self._exposure -= abs(qty * old_mark)
+            self.last_price[idx] = price
+            self._unrealized += new_qty * (price - float(self.avg_cost[idx]))
+            self._exposure += abs(new_qty * price)
+            self._update_drawdown()
+
+            return self._position(idx)
+
+    def mark_to_market(self, prices: Dict[str, float]):
+        """用最新价格对所有持仓一次性盯市"""
+        with self._lock:
+            known = [(self._index[s], p) for s, p in prices.items() if s in self._index and p > 0]
+            if known:
+                idx, px = zip(*known)
+                self.last_price[list(idx)] = px
+
+            self._recompute_totals()
+
+    def sync_positions(self, positions: Dict[str, Dict]):
+        """用外部持仓（如分片共享内存中的各交易对持仓）覆盖对应行并重算汇总值
+
+        分片模式下每个 worker 在周期开始时同步全部持仓，因此接手转移来的
+        交易对时沿用原有持仓，总敞口和回撤也按所有 worker 的持仓计算。
+        """
+        with self._lock:
+            for symbol, position in positions.items():
+                idx = self._slot(symbol)
+                self.quantity[idx] = position['quantity']
+                self.avg_cost[idx] = position['avg_cost']
+                self.realized_pnl[idx] = position['realized_pnl']
+                self.fees[idx] = position['fees']
+                if not self.last_price[idx]:
+                    self.last_price[idx] = position['avg_cost']
+
+            self._recompute_totals()
+
+    def _recompute_totals(self):
+        n = len(self._symbols)
+        qty = self.quantity[:n]
+        last = self.last_price[:n]
+        self._unrealized = float(np.dot(qty, last - self.avg_cost[:n]))
+        self._exposure = float(np.abs(qty * last).sum())
+        self._update_drawdown()
+
+    def _update_drawdown(self):
+        equity = self._equity()
+        if equity > self._peak_equity:
+            self._peak_equity = equity
+        if self._peak_equity > 0:
+            drawdown = (self._peak_equity - equity) / self._peak_equity * 100
+            self._max_drawdown = max(self._max_drawdown, drawdown)
+
+    def _equity(self) -> float:
+        n = len(self._symbols)
+        return (self.initial_capital + float(self.realized_pnl[:n].sum())
+                - float(self.fees[:n].sum()) + self._unrealized)
+
+    def _position(self, idx: int) -> Dict:
+        qty = float(self.quantity[idx])
+        last = float(self.last_price[idx])
+        avg = float(self.avg_cost[idx])
+        return {
+            'symbol': self._symbols[idx],
+            'quantity': qty,
+            'avg_cost': avg,
+            'last_price': last,
+            'market_value': qty * last,
+            'unrealized_pnl': qty * (last - avg),
+            'realized_pnl': float(self.realized_pnl[idx]),
+            'fees': float(self.fees[idx])
+        }
+
+    def get_position(self, symbol: str) -> Optional[Dict]:
+        """获取单个交易对的持仓"""
+        with self._lock:
+            idx = self._index.get(symbol)
+            return self._position(idx) if idx is not None else None
+
+    def get_positions(self) -> List[Dict]:
+        """获取所有未平仓持仓"""
+        with self._lock:
+            return [self._position(i) for i in np.flatnonzero(self.quantity[:len(self._symbols)])]
+
+    def get_summary(self) -> Dict:
+        """获取敞口、盈亏和回撤汇总"""
+        with self._lock:
+            n = len(self._symbols)
+            equity = self._equity()
+            return {
+                'open_positions': int(np.count_nonzero(self.quantity[:n])),
+                'total_exposure': self._exposure,
+                'unrealized_pnl': self._unrealized,
+                'realized_pnl': float(self.realized_pnl[:n].sum()),
+                'total_fees': float(self.fees[:n].sum()),
+                'equity': equity,
+                'peak_equity': self._peak_equity,
+                'current_drawdown_pct': (self._peak_equity - equity) / self._peak_equity * 100 if self._peak_equity > 0 else 0.0,
+                'max_drawdown_pct': self._max_drawdown
+            }
+
+    def check_order(self, symbol: str, amount: float, price: float, is_buy: bool,
+                    pending_exposure: float = 0.0) -> Dict:
+        """下单前风控检查，仅读取内存账本
+
+        pending_exposure 为同一批次中已通过检查但尚未记账的订单名义价值，
+        计入总敞口，避免整批下单时每笔都只和旧账本比较。
+        """
+        if not price or price <= 0:
+            # 没有可用价格时无法估算持仓价值，一律拒绝
+            return {'allowed': False, 'reason': '缺少价格'}
+        with self._lock:
+            idx = self._index.get(symbol)
+            qty = float(self.quantity[idx]) if idx is not None else 0.0
+            mark = float(self.last_price[idx]) if idx is not None and self.last_price[idx] > 0 else price
+            new_qty = qty + (amount if is_buy else -amount)
+
+            position_value = abs(new_qty * price)
+            exposure = self._exposure - abs(qty * mark) + position_value + pending_exposure
+            equity = self._equity()
+            drawdown = (self._peak_equity - equity) / self._peak_equity * 100 if self._peak_equity > 0 else 0.0
+
+        reducing = abs(new_qty) < abs(qty)
+        if reducing:
+            # 减仓总是允许，便于风控触发后退出
+            return {'allowed': True, 'reason': '减仓', 'reducing': True}
+        if drawdown >= self.max_drawdown_pct:
+            return {'allowed': False, 'reason': f'回撤 {drawdown:.2f}% 超过上限 {self.max_drawdown_pct}%'}
+        if position_value > self.max_position_value:
+            return {'allowed': False, 'reason': f'单币持仓 {position_value:.2f} 超过上限 {self.max_position_value}'}
+        if exposure > self.max_total_exposure:
+            return {'allowed': False, 'reason': f'总敞口 {exposure:.2f} 超过上限 {self.max_total_exposure}'}
+        return {'allowed': True, 'reason': '通过', 'reducing': False}
+
+
+async def main():
+    ledger = PositionLedger(initial_capital=10000.0)
+
+    # Example fills
+    ledger.apply_fill("DOGEUSDT", 1000, 0.10, is_buy=True, fee=0.1)
+    ledger.apply_fill("DOGEUSDT", 500, 0.12, is_buy=True, fee=0.06)
+    ledger.apply_fill("PEPEUSDT", 1000000, 0.000001, is_buy=True)
+    ledger.apply_fill("DOGEUSDT", 600, 0.13, is_buy=False, fee=0.08)
+
+    # Mark all open positions in one step
+    ledger.mark_to_market({"DOGEUSDT": 0.09, "PEPEUSDT": 0.0000012})
+
+    print("\nPositions:")
+    for position in ledger.get_positions():
+        print(position)
+    print("\nSummary:")
+    print(ledger.get_summary())
+    print("\nPre-trade check:")
+    print(ledger.check_order("DOGEUSDT", 50000, 0.09, is_buy=True))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,291 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 请求优先级，数值越小越先放行
+PRIORITY_CRITICAL = 0  # 下单、撤单
+PRIORITY_HIGH = 1      # 持仓币种的行情和深度
+PRIORITY_NORMAL = 2
+PRIORITY_BULK = 3      # 全市场扫描
+
+# 被限流时的 HTTP 状态码（Binance 在多次 429 后返回 418 封禁 IP）
+THROTTLE_STATUSES = (418, 429)
+
+
+class _Upstream:
+    """单个上游接口的权重预算和并发状态"""
+
+    def __init__(self, name: str, weight_limit: int, window: float, used_weight_header: Optional[str] = None,
+                 reserve_ratio: float = 0.2, min_concurrency: int = 1, max_concurrency: int = 32,
+                 initial_concurrency: int = 4):
+        self.name = name
+        self.weight_limit = weight_limit
+        self.window = window
+        self.used_weight_header = used_weight_header
+        self.reserve_ratio = reserve_ratio
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(initial_concurrency)
+        self.used = 0
+        self.window_start = 0.0
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.waiters = []
+        self.timer = None
+        self.stats = {'requests': 0, 'throttled': 0, 'queued_max': 0}
+
+    def roll_window(self, now: float):
+        if now >= self.window_start + self.window:
+            # 与交易所一致按整窗口对齐（如整分钟）
+            self.window_start = now - (now % self.window)
+            self.used = 0
+
+
+class RequestGovernor:
+    """所有外部请求共用的限流器
+
+    按上游分别跟踪窗口内的权重预算，读取交易所返回的已用权重和
+    Retry-After 头校准本地计数，并发上限按 AIMD 调整：成功时缓慢加一，
+    被限流时减半。等待中的请求按优先级放行，低优先级请求只能使用
+    预算中扣除保留部分后的额度，高优先级请求（下单、持仓深度）总能先行。
+    """
+
+    def __init__(self, increase: float = 1.0, decrease: float = 0.5):
+        self.increase = increase
+        self.decrease = decrease
+        self._upstreams: Dict[str, _Upstream] = {}
+        self._sequence = itertools.count()
+
+    def register(self, name: str, weight_limit: int, window: float, **options):
+        """登记一个上游及其权重预算"""
+        self._upstreams[name] = _Upstream(name, weight_limit, window, **options)
+
+    async def acquire(self, upstream: str, weight: int = 1, priority: int = PRIORITY_NORMAL) -> float:
+        """等待直到该请求可以发出，返回放行时刻，结束时原样传给 release"""
+        up = self._upstreams[upstream]
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(up.waiters, (priority, next(self._sequence), weight, future))
+        up.stats['queued_max'] = max(up.stats['queued_max'], len(up.waiters))
+        self._dispatch(up)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已被放行后才取消：名额和权重已计入，必须归还，否则并发名额泄漏
+            if future.done() and not future.cancelled():
+                up.used = max(0, up.used - weight)
+                self.release(upstream)
+            raise
+        return time.time()
+
+    def release(self, upstream: str, status: Optional[int] = None, headers=None, sent_at: Optional[float] = None):
+        """请求结束后归还并发名额，并根据响应调整预算和并发"""
+        up = self._upstreams[upstream]
+        up.in_flight -= 1
+        if status is not None:
+            self._observe(up, status, headers or {}, sent_at)
+        self._dispatch(up)
+
+    @asynccontextmanager
+    async def request(self, session, method: str, url: str, upstream: str, weight: int = 1,
+                      priority: int = PRIORITY_NORMAL, **kwargs):
+        """经限流器发出 aiohttp 请求"""
+        sent_at = await self.acquire(upstream, weight, priority)
+        status, headers = None, None
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                status, headers = response.status, response.headers
+                yield response
+        finally:
+            self.release(upstream, status, headers, sent_at)
+
+    def _observe(self, up: _Upstream, status: int, headers, sent_at: Optional[float] = None):
+        now = time.time()
+        up.roll_window(now)
+        stale = sent_at is not None and sent_at < up.window_start
+        if up.used_weight_header and headers.get(up.used_weight_header) and not stale:
+            # 以交易所返回的已用权重为准，本地只补上仍在途的请求；
+            # 上一个窗口发出的请求带回的是旧窗口的计数，不能用来覆盖新窗口
+            up.used = max(up.used, int(headers[up.used_weight_header]))
+
+        if status in THROTTLE_STATUSES:
+            retry_after = headers.get('Retry-After')
+            delay = float(retry_after) if retry_after else up.window_start + up.window - now
+            up.blocked_until = max(up.blocked_until, now + delay)
+            # 同一次限流会让所有在途请求都收到 429，只对回退之后才发出的请求再次减半
+            if sent_at is None or sent_at >= up.last_decrease:
+                up.concurrency = max(up.min_concurrency, up.concurrency * self.decrease)
+                up.last_decrease = now
+            up.stats['throttled'] += 1
+            logger.warning("%s 被限流 (HTTP %d)，暂停 %.1fs，并发降至 %.1f", up.name, status, delay, up.concurrency)
+        elif status < 500:
+            up.concurrency = min(up.max_concurrency, up.concurrency + self.increase / up.concurrency)
+
+    def _dispatch(self, up: _Upstream):
+        now = time.time()
+        up.roll_window(now)
+        while up.waiters:
+            priority, _, weight, future = up.waiters[0]
+            if future.done():
+                heapq.heappop(up.waiters)
+                continue
+            if now < up.blocked_until:
+                self._wake_at(up, up.blocked_until - now)
+                return
+            if up.in_flight >= int(up.concurrency):
+                return
+            limit = up.weight_limit if priority <= PRIORITY_HIGH else up.weight_limit * (1 - up.reserve_ratio)
+            if up.used + weight > limit:
+                self._wake_at(up, up.window_start + up.window - now)
+                return
+            heapq.heappop(up.waiters)
+            up.used += weight
+            up.in_flight += 1
+            up.stats['requests'] += 1
+            future.set_result(None)
+
+    def _wake_at(self, up: _Upstream, delay: float):
+        if up.timer is None or up.timer.when() > asyncio.get_running_loop().time() + delay:
+            if up.timer:
+                up.timer.cancel()
+            up.timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._on_timer, up)
+
+    def _on_timer(self, up: _Upstream):
+        up.timer = None
+        self._dispatch(up)
+
+    def get_status(self) -> Dict:
+        return {
+            name: {
+                'used_weight': up.used,
+                'weight_limit': up.weight_limit,
+                'concurrency': round(up.concurrency, 2),
+                'in_flight': up.in_flight,
+                'waiting': len(up.waiters),
+                'blocked_for': max(0.0, up.blocked_until - time.time()),
+                **up.stats
+            }
+            for name, up in self._upstreams.items()
+        }
+
+
+def binance_depth_weight(limit: int) -> int:
+    """Binance /depth 接口的请求权重"""
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 25
+    if limit <= 1000:
+        return 50
+    return 250
+
+
+# 全局限流器实例（每个进程一个；分片部署时应按 worker 数缩小预算）
+governor = RequestGovernor()
+governor.register('binance', weight_limit=6000, window=60, used_weight_header='X-MBX-USED-WEIGHT-1M',
+                  max_concurrency=20)
+governor.register('twitter', weight_limit=180, window=900, max_concurrency=2, initial_concurrency=1)
+governor.register('infura', weight_limit=500, window=1, max_concurrency=20)
+governor.register('openai', weight_limit=60, window=60, max_concurrency=4, initial_concurrency=2)
+
+
+async def run_limited_exchange(weight_limit: int, window: float, report_used_weight: bool = True):
+    """启动本地限流交易所桩：超出权重返回 429 和 Retry-After"""
+    from aiohttp import web
+
+    state = {'used': 0, 'window_start': time.time(), 'rejected': 0}
+
+    async def handle(request):
+        now = time.time()
+        if now >= state['window_start'] + window:
+            state['window_start'] = now - (now % window)
+            state['used'] = 0
+        weight = int(request.query.get('weight', 1))
+        state['used'] += weight
+        headers = {'X-MBX-USED-WEIGHT-1M': str(state['used'])} if report_used_weight else {}
+        if state['used'] > weight_limit:
+            state['rejected'] += 1
+            headers['Retry-After'] = str(round(state['window_start'] + window - now, 3))
+            return web.json_response({'code': -1003, 'msg': 'Too many requests'}, status=429, headers=headers)
+        await asyncio.sleep(0.005)
+        return web.json_response({'ok': True}, headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/api/v3/depth', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", state
+
+
+async def main():
+    import aiohttp
+
+    runner, base_url, exchange = await run_limited_exchange(weight_limit=200, window=2)
+    local = RequestGovernor()
+    local.register('exchange', weight_limit=200, window=2, used_weight_header='X-MBX-USED-WEIGHT-1M')
+    latencies = {PRIORITY_HIGH: [], PRIORITY_BULK: []}
+
+    async def call(priority: int, weight: int):
+        started = time.perf_counter()
+        async with local.request(session, 'GET', f"{base_url}/api/v3/depth?weight={weight}", 'exchange',
+                                 weight=weight, priority=priority) as response:
+            await response.read()
+        latencies[priority].append(time.perf_counter() - started)
+
+    # Example usage: a bulk scan saturating the budget while open-position depth requests keep flowing
+    async with aiohttp.ClientSession() as session:
+        bulk = [call(PRIORITY_BULK, 5) for _ in range(150)]
+        high = [call(PRIORITY_HIGH, 5) for _ in range(20)]
+        started = time.perf_counter()
+        await asyncio.gather(*bulk, *high)
+        elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    print(f"170 requests in {elapsed:.2f}s, exchange rejected {exchange['rejected']}")
+    for priority, name in ((PRIORITY_HIGH, 'high'), (PRIORITY_BULK, 'bulk')):
+        samples = sorted(latencies[priority])
+        print(f"{name}: p50={samples[len(samples) // 2]:.3f}s max={samples[-1]:.3f}s")
+    print(local.get_status())
+
+    # Example usage: a budget set above the exchange's real limit and no used-weight header,
+    # so only 429 + Retry-After and the AIMD back-off keep the client in line
+    runner, base_url, exchange = await run_limited_exchange(weight_limit=200, window=2, report_used_weight=False)
+    loose = RequestGovernor()
+    loose.register('exchange', weight_limit=400, window=2, initial_concurrency=8, max_concurrency=16)
+
+    async def scan(count: int) -> Dict[int, int]:
+        statuses: Dict[int, int] = {}
+
+        async def one():
+            async with loose.request(session, 'GET', f"{base_url}/api/v3/depth?weight=5", 'exchange',
+                                     weight=5, priority=PRIORITY_BULK) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        await asyncio.gather(*(one() for _ in range(count)))
+        return statuses
+
+    async with aiohttp.ClientSession() as session:
+        started = time.perf_counter()
+        statuses = await scan(80)
+        status = loose.get_status()['exchange']
+        print(f"\nOver-budget scan: {statuses} in {time.perf_counter() - started:.2f}s, "
+              f"throttled {status['throttled']}, concurrency {status['concurrency']}")
+        for round_no in range(3):
+            statuses = await scan(30)
+            status = loose.get_status()['exchange']
+            print(f"Recovery round {round_no + 1}: {statuses}, throttled {status['throttled']}, "
+                  f"concurrency {status['concurrency']}")
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,239 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SENTIMENT_VALUES = {'positive': 1.0, 'neutral': 0.0, 'negative': -1.0}
+
+DEFAULT_WINDOWS = {'5m': 300, '1h': 3600, '24h': 86400}
+
+
+def influence_weight(tweet: Dict, kol_multiplier: float = 3.0) -> float:
+    """按粉丝数、转发、点赞和 KOL 身份计算一条推文的影响力权重"""
+    user = tweet.get("user", {})
+    weight = math.log1p(user.get("followers_count", 0) or 0) + 1.0
+    weight *= 1.0 + math.log1p(tweet.get("retweet_count", 0) or 0) + 0.5 * math.log1p(tweet.get("favorite_count", 0) or 0)
+    if tweet.get("is_kol"):
+        weight *= kol_multiplier
+    return weight
+
+
+class _TokenWindow:
+    """单个代币的分桶滑动窗口
+
+    固定大小的环形桶数组覆盖最长窗口，每个窗口另维护一份累计值：新推文
+    落桶时加到覆盖它的窗口上，时间推进时把离开窗口的桶减掉，因此写入和
+    查询都不需要回扫历史推文。
+    """
+
+    def __init__(self, windows: Dict[str, int], bucket_seconds: int, half_life: float):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = {name: max(1, seconds // bucket_seconds) for name, seconds in windows.items()}
+        self.size = max(self.window_buckets.values())
+        self.count = [0] * self.size
+        self.kol = [0] * self.size
+        self.weight = [0.0] * self.size
+        self.weighted_sentiment = [0.0] * self.size
+        self.head = None
+        self.totals = {name: [0, 0, 0.0, 0.0] for name in self.window_buckets}
+
+        # 指数衰减的累计值，比值与查询时刻无关
+        self.half_life = half_life
+        self.decayed_sentiment = 0.0
+        self.decayed_weight = 0.0
+        self.decayed_time = None
+
+    def advance(self, bucket: int):
+        """把窗口推进到指定桶，移出已离开各窗口的桶"""
+        if self.head is None:
+            self.head = bucket
+            return
+        if bucket <= self.head:
+            return
+        if bucket - self.head >= self.size:
+            # 超过最长窗口没有数据，直接清空
+            self.count = [0] * self.size
+            self.kol = [0] * self.size
+            self.weight = [0.0] * self.size
+            self.weighted_sentiment = [0.0] * self.size
+            self.totals = {name: [0, 0, 0.0, 0.0] for name in self.window_buckets}
+            self.head = bucket
+            return
+        for new_bucket in range(self.head + 1, bucket + 1):
+            for name, span in self.window_buckets.items():
+                leaving = (new_bucket - span) % self.size
+                totals = self.totals[name]
+                totals[0] -= self.count[leaving]
+                totals[1] -= self.kol[leaving]
+                totals[2] -= self.weight[leaving]
+                totals[3] -= self.weighted_sentiment[leaving]
+            slot = new_bucket % self.size
+            self.count[slot] = 0
+            self.kol[slot] = 0
+            self.weight[slot] = 0.0
+            self.weighted_sentiment[slot] = 0.0
+        self.head = bucket
+
+    def add(self, timestamp: float, sentiment: float, weight: float, is_kol: bool):
+        bucket = int(timestamp // self.bucket_seconds)
+        self.advance(bucket)
+        age = self.head - bucket
+        if age >= self.size:
+            return
+        slot = bucket % self.size
+        self.count[slot] += 1
+        self.kol[slot] += int(is_kol)
+        self.weight[slot] += weight
+        self.weighted_sentiment[slot] += weight * sentiment
+        for name, span in self.window_buckets.items():
+            if age < span:
+                totals = self.totals[name]
+                totals[0] += 1
+                totals[1] += int(is_kol)
+                totals[2] += weight
+                totals[3] += weight * sentiment
+
+        if self.decayed_time is None or timestamp >= self.decayed_time:
+            factor = 2.0 ** (-(timestamp - self.decayed_time) / self.half_life) if self.decayed_time is not None else 1.0
+            self.decayed_sentiment = self.decayed_sentiment * factor + weight * sentiment
+            self.decayed_weight = self.decayed_weight * factor + weight
+            self.decayed_time = timestamp
+        else:
+            factor = 2.0 ** (-(self.decayed_time - timestamp) / self.half_life)
+            self.decayed_sentiment += weight * sentiment * factor
+            self.decayed_weight += weight * factor
+
+
+class SentimentAggregator:
+    """按代币流式聚合社交情绪
+
+    每条推文按影响力加权后 O(1) 写入该代币的分桶窗口，可随时查询 5m/1h/24h
+    等窗口内的提及数、KOL 提及数和加权情绪，以及提及速度和加速度。
+    同一条推文在多个周期被重复抓取时按 ID 去重。
+    """
+
+    def __init__(self, windows: Optional[Dict[str, int]] = None, bucket_seconds: int = 60,
+                 half_life: float = 1800.0, velocity_window: int = 300, kol_multiplier: float = 3.0,
+                 dedup_size: int = 5000):
+        self.windows = dict(windows or DEFAULT_WINDOWS)
+        self.velocity_window = velocity_window
+        # 内部窗口：用于计算上一段时间的提及数，进而得到加速度
+        self.windows['_velocity'] = velocity_window
+        self.windows['_velocity_prev'] = velocity_window * 2
+        self.bucket_seconds = bucket_seconds
+        self.half_life = half_life
+        self.kol_multiplier = kol_multiplier
+        self.dedup_size = dedup_size
+        self._tokens: Dict[str, _TokenWindow] = {}
+        self._seen: Dict[str, set] = {}
+        self._seen_order: Dict[str, deque] = {}
+
+    def _window(self, token: str) -> _TokenWindow:
+        window = self._tokens.get(token)
+        if window is None:
+            window = self._tokens[token] = _TokenWindow(self.windows, self.bucket_seconds, self.half_life)
+            self._seen[token] = set()
+            self._seen_order[token] = deque()
+        return window
+
+    def add_tweet(self, token: str, tweet: Dict) -> bool:
+        """写入一条已处理的推文，重复推文返回 False"""
+        window = self._window(token)
+        tweet_id = tweet.get("id")
+        if tweet_id is not None:
+            seen = self._seen[token]
+            if tweet_id in seen:
+                return False
+            seen.add(tweet_id)
+            order = self._seen_order[token]
+            order.append(tweet_id)
+            if len(order) > self.dedup_size:
+                seen.discard(order.popleft())
+
+        created_at = tweet.get("created_at")
+        timestamp = datetime.fromisoformat(created_at).timestamp() if created_at else time.time()
+        window.add(
+            timestamp,
+            SENTIMENT_VALUES.get(tweet.get("sentiment"), 0.0),
+            influence_weight(tweet, self.kol_multiplier),
+            bool(tweet.get("is_kol"))
+        )
+        return True
+
+    def add_tweets(self, token: str, tweets: List[Dict]) -> int:
+        """批量写入，返回新增推文数"""
+        return sum(self.add_tweet(token, tweet) for tweet in tweets)
+
+    def query(self, token: str, window: str = '1h', now: Optional[float] = None) -> Dict:
+        """查询某个窗口内的聚合值"""
+        state = self._tokens.get(token)
+        if state is None:
+            return {'mentions': 0, 'kol_mentions': 0, 'weighted_sentiment': 0.0, 'total_weight': 0.0}
+        state.advance(int((now if now is not None else time.time()) // self.bucket_seconds))
+        count, kol, weight, weighted = state.totals[window]
+        return {
+            'mentions': count,
+            'kol_mentions': kol,
+            'weighted_sentiment': weighted / weight if weight > 0 else 0.0,
+            'total_weight': weight
+        }
+
+    def summary(self, token: str, now: Optional[float] = None) -> Dict:
+        """所有公开窗口的聚合值，外加提及速度、加速度和衰减情绪"""
+        now = now if now is not None else time.time()
+        result = {name: self.query(token, name, now) for name in self.windows if not name.startswith('_')}
+
+        recent = self.query(token, '_velocity', now)['mentions']
+        previous = self.query(token, '_velocity_prev', now)['mentions'] - recent
+        minutes = self.velocity_window / 60
+        result['mention_velocity'] = recent / minutes
+        result['mention_acceleration'] = (recent - previous) / minutes / minutes
+
+        state = self._tokens.get(token)
+        result['decayed_sentiment'] = state.decayed_sentiment / state.decayed_weight \
+            if state and state.decayed_weight > 0 else 0.0
+        return result
+
+    def tokens(self) -> List[str]:
+        return list(self._tokens)
+
+
+async def main():
+    aggregator = SentimentAggregator()
+    now = time.time()
+
+    # Example usage: 500k tweets over 24h for 100 tokens, with a burst of positive KOL chatter on one token
+    started = time.perf_counter()
+    for i in range(500000):
+        token = f"MEME{random.randint(0, 99)}"
+        timestamp = now - 86400 + i * 86400 / 500000
+        burst = token == "MEME7" and timestamp > now - 600
+        tweet = {
+            "id": str(i),
+            "created_at": datetime.fromtimestamp(timestamp).isoformat(),
+            "user": {"followers_count": random.randint(10, 500000)},
+            "retweet_count": random.randint(0, 100),
+            "favorite_count": random.randint(0, 500),
+            "sentiment": "positive" if burst else random.choice(["positive", "neutral", "negative"]),
+            "is_kol": burst and random.random() < 0.5
+        }
+        aggregator.add_tweet(token, tweet)
+        if burst:
+            for extra in range(5):
+                aggregator.add_tweet(token, {**tweet, "id": f"{i}-{extra}"})
+    elapsed = time.perf_counter() - started
+    print(f"Ingested 500k tweets in {elapsed:.2f}s ({elapsed / 500000 * 1e6:.1f} us/tweet)")
+
+    started = time.perf_counter()
+    summaries = {token: aggregator.summary(token, now) for token in aggregator.tokens()}
+    print(f"Queried {len(summaries)} tokens in {(time.perf_counter() - started) * 1000:.2f} ms")
+    for token in ("MEME7", "MEME8"):
+        summary = summaries[token]
+        print(token, {k: (round(v['weighted_sentiment'], 3), v['mentions']) if isinstance(v, dict) else round(v, 3)
+                      for k, v in summary.items()})
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,494 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = np.dtype([('capacity', '<u8'), ('depth', '<u8')])
+
+
+def _slot_dtype(depth: int) -> np.dtype:
+    return np.dtype([
+        ('symbol', 'S24'),
+        ('seq', '<u8'),
+        ('price', '<f8'),
+        ('volume', '<f8'),
+        ('updated', '<f8'),
+        ('bid_px', '<f8', (depth,)),
+        ('bid_qty', '<f8', (depth,)),
+        ('ask_px', '<f8', (depth,)),
+        ('ask_qty', '<f8', (depth,)),
+        ('pos_updated', '<f8'),
+        ('pos_qty', '<f8'),
+        ('pos_avg_cost', '<f8'),
+        ('pos_realized', '<f8'),
+        ('pos_fees', '<f8')
+    ])
+
+
+class SharedMarketState:
+    """共享内存中的最新行情和盘口
+
+    每个交易对占一个固定槽位，由负责该交易对的 worker 单独写入；Web 应用和
+    风控通过 attach 挂到同一段内存上直接读取 numpy 视图，无需拷贝或查库。
+    写入使用序列锁：写前后各递增一次 seq，读到奇数或前后不一致时重读。
+    槽位里同时保存该交易对的持仓，分片转移后新的负责 worker 接着使用，
+    各 worker 也据此按全部持仓做总敞口和回撤风控。worker 之间的下单检查
+    不加锁，持仓在成交后才写回，因此总敞口最多超出 (worker 数 - 1) 笔
+    订单的价值。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._owner = owner
+        header = np.ndarray((1,), dtype=_HEADER, buffer=shm.buf)[0]
+        self.capacity = int(header['capacity'])
+        self.depth = int(header['depth'])
+        self.slots = np.ndarray((self.capacity,), dtype=_slot_dtype(self.depth), buffer=shm.buf,
+                                offset=_HEADER.itemsize)
+        self._index = {name.decode(): i for i, name in enumerate(self.slots['symbol']) if name}
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @classmethod
+    def create(cls, symbols: List[str], depth: int = 5, name: Optional[str] = None) -> 'SharedMarketState':
+        """创建共享内存段并为每个交易对分配槽位"""
+        size = _HEADER.itemsize + _slot_dtype(depth).itemsize * len(symbols)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((1,), dtype=_HEADER, buffer=shm.buf)
+        header[0] = (len(symbols), depth)
+        slots = np.ndarray((len(symbols),), dtype=_slot_dtype(depth), buffer=shm.buf, offset=_HEADER.itemsize)
+        slots[:] = np.zeros(len(symbols), dtype=slots.dtype)
+        slots['symbol'] = [s.encode() for s in symbols]
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedMarketState':
+        """挂载已存在的共享内存段（只有创建者负责释放）"""
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.13 之前没有 track 参数：挂载期间跳过资源跟踪登记，避免读者退出时删除内存段
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        return cls(shm, owner=False)
+
+    def _begin_write(self, slot) -> int:
+        """进入写入区，返回写完后应设置的序号
+
+        持有该槽位的 worker 在写入途中被终止时 seq 停在奇数，接手的 worker
+        直接从这个奇数继续，写完恢复为偶数。
+        """
+        seq = int(slot['seq'][0])
+        if seq % 2 == 0:
+            seq += 1
+            slot['seq'] = seq
+        return seq + 1
+
+    def publish(self, symbol: str, price: float, volume: float = 0.0, order_book: Optional[Dict] = None):
+        """写入一个交易对的最新价格和前若干档盘口"""
+        slot = self.slots[self._index[symbol]:self._index[symbol] + 1]
+        end_seq = self._begin_write(slot)
+        slot['price'] = price
+        slot['volume'] = volume
+        if order_book:
+            for side in ('bid', 'ask'):
+                levels = np.asarray(order_book.get(f"{side}s", [])[:self.depth], dtype=np.float64).reshape(-1, 2)
+                px = np.zeros(self.depth)
+                qty = np.zeros(self.depth)
+                px[:len(levels)] = levels[:, 0]
+                qty[:len(levels)] = levels[:, 1]
+                slot[f'{side}_px'] = px
+                slot[f'{side}_qty'] = qty
+        slot['updated'] = time.time()
+        slot['seq'] = end_seq
+
+    def publish_market_data(self, symbol: str, market_data: Dict):
+        """从 MarketDataCollector 的结果中提取最新价格和盘口写入"""
+        klines = market_data.get("klines") or []
+        if not klines:
+            return
+        last = klines[-1]
+        self.publish(symbol, float(last[4]), float(last[5]), market_data.get("order_book"))
+
+    def publish_position(self, symbol: str, position: Dict):
+        """写入一个交易对的持仓（PositionLedger 的持仓字典）"""
+        slot = self.slots[self._index[symbol]:self._index[symbol] + 1]
+        end_seq = self._begin_write(slot)
+        slot['pos_qty'] = position['quantity']
+        slot['pos_avg_cost'] = position['avg_cost']
+        slot['pos_realized'] = position['realized_pnl']
+        slot['pos_fees'] = position['fees']
+        slot['pos_updated'] = time.time()
+        slot['seq'] = end_seq
+
+    def get_positions(self, retries: int = 100) -> Dict[str, Dict]:
+        """读取所有记录过持仓的交易对，可直接传给 PositionLedger.sync_positions
+
+        逐槽位校验序号，只重读正在写入的槽位；重试用尽仍不一致的槽位（写入者
+        已退出）取最后一次读到的值。
+        """
+        fields = ['symbol', 'pos_updated', 'pos_qty', 'pos_avg_cost', 'pos_realized', 'pos_fees']
+        pending = np.arange(self.capacity)
+        records = None
+        for _ in range(retries):
+            before = self.slots['seq'][pending]
+            snapshot = self.slots[fields][pending]
+            stable = (before % 2 == 0) & (before == self.slots['seq'][pending])
+            if records is None:
+                records = snapshot
+            else:
+                records[pending] = snapshot
+            pending = pending[~stable]
+            if not len(pending):
+                break
+        return {
+            record['symbol'].decode(): {
+                'quantity': float(record['pos_qty']),
+                'avg_cost': float(record['pos_avg_cost']),
+                'realized_pnl': float(record['pos_realized']),
+                'fees': float(record['pos_fees'])
+            }
+            for record in records[records['pos_updated'] > 0]
+        }
+
+    def get(self, symbol: str, retries: int = 100) -> Optional[Dict]:
+        """读取一个交易对的一致快照"""
+        idx = self._index.get(symbol)
+        if idx is None:
+            return None
+        slot = self.slots[idx]
+        for _ in range(retries):
+            before = int(slot['seq'])
+            if before % 2 == 0:
+                record = slot.copy()
+                if int(slot['seq']) == before:
+                    return {
+                        'symbol': symbol,
+                        'price': float(record['price']),
+                        'volume': float(record['volume']),
+                        'updated': float(record['updated']),
+                        'bids': np.column_stack([record['bid_px'], record['bid_qty']]).tolist(),
+                        'asks': np.column_stack([record['ask_px'], record['ask_qty']]).tolist()
+                    }
+        return None
+
+    def get_price(self, symbol: str) -> Optional[float]:
+        idx = self._index.get(symbol)
+        if idx is None or self.slots['updated'][idx] == 0:
+            return None
+        return float(self.slots['price'][idx])
+
+    def get_prices(self) -> Dict[str, float]:
+        """读取所有已有报价的交易对价格，可直接用于持仓盯市"""
+        updated = np.flatnonzero(self.slots['updated'] > 0)
+        return {self.slots['symbol'][i].decode(): float(self.slots['price'][i]) for i in updated}
+
+    def close(self):
+        # 先释放 numpy 视图，否则共享内存缓冲区无法关闭
+        self.slots = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class BotCycle:
+    """默认的分片周期：每个 worker 进程内复用一个交易机器人实例
+
+    start/stop 在 worker 进程内各调用一次，完成与单进程模式相同的启动
+    和收尾：配置日志、启动通知队列和执行会话，退出时写出特征缓冲并
+    发送剩余通知。
+    """
+
+    def __init__(self, log_dir: str = 'logs'):
+        self.log_dir = log_dir
+        self.bot = None
+
+    async def start(self, worker_id: int, state: SharedMarketState):
+        from main import MemeCoinTradingBot
+        from structured_logging import setup_logging
+        # 每个 worker 写自己的文件，避免多进程同时轮转同一个文件
+        setup_logging(log_dir=self.log_dir, filename=f"trading_bot.worker{worker_id}.jsonl")
+        self.bot = MemeCoinTradingBot()
+        self.bot.market_state = state
+        await self.bot.start()
+
+    async def stop(self):
+        if self.bot is not None:
+            await self.bot.stop()
+            self.bot = None
+
+    async def __call__(self, symbol: str, state: SharedMarketState):
+        base = symbol[:-4] if symbol.endswith("USDT") else symbol
+        await self.bot.run_once(symbol, twitter_query=f"#{base}")
+
+
+bot_cycle = BotCycle()
+
+
+def _worker_entry(worker_id: int, shm_name: str, control: mp.Queue, heartbeats, interval: float,
+                  cycle_fn: Callable):
+    """worker 进程入口"""
+    asyncio.run(_worker_loop(worker_id, shm_name, control, heartbeats, interval, cycle_fn))
+
+
+async def _worker_loop(worker_id: int, shm_name: str, control: mp.Queue, heartbeats, interval: float,
+                       cycle_fn: Callable):
+    state = SharedMarketState.attach(shm_name)
+    # 带 start/stop 的周期对象在 worker 内做一次性启动和收尾
+    start, stop = getattr(cycle_fn, 'start', None), getattr(cycle_fn, 'stop', None)
+    if start is not None:
+        await start(worker_id, state)
+    try:
+        await _run_shard(worker_id, state, control, heartbeats, interval, cycle_fn)
+    finally:
+        if stop is not None:
+            await stop()
+        state.close()
+
+
+async def _run_shard(worker_id: int, state: SharedMarketState, control: mp.Queue, heartbeats, interval: float,
+                     cycle_fn: Callable):
+    symbols: List[str] = []
+    while True:
+        # 处理分片调整消息，只保留最新一次分配
+        try:
+            while True:
+                message = control.get_nowait()
+                if message is None:
+                    return
+                symbols = message
+        except queue.Empty:
+            pass
+
+        started = time.time()
+        for symbol in symbols:
+            try:
+                await cycle_fn(symbol, state)
+            except Exception as e:
+                logger.error("worker %d 处理 %s 出错: %s", worker_id, symbol, e)
+            heartbeats[worker_id] = time.time()
+        heartbeats[worker_id] = time.time()
+
+        # 等待下一轮期间也响应分片调整，被转移来的交易对无需等满一个周期
+        deadline = started + interval
+        while time.time() < deadline and control.empty():
+            await asyncio.sleep(min(1.0, max(0.0, deadline - time.time())))
+
+
+class ShardSupervisor:
+    """多进程分片监督器
+
+    把交易对池轮流均匀分给 N 个 worker 进程，各自独立跑周期并把行情
+    写入共享内存。worker 崩溃或心跳超时后，其分片立即转给存活的 worker，
+    随后重启该 worker 并重新均衡分片。
+    """
+
+    def __init__(self, symbols: List[str], num_workers: int = os.cpu_count() or 2,
+                 cycle_fn: Callable = bot_cycle, interval: float = 300.0, depth: int = 5,
+                 heartbeat_timeout: Optional[float] = None, max_restarts: int = 5, shm_name: Optional[str] = None):
+        self.symbols = list(symbols)
+        self.num_workers = num_workers
+        self.cycle_fn = cycle_fn
+        self.interval = interval
+        self.heartbeat_timeout = heartbeat_timeout or interval * 3
+        self.max_restarts = max_restarts
+        self._ctx = mp.get_context('spawn')
+        self.state = SharedMarketState.create(self.symbols, depth=depth, name=shm_name)
+        self._heartbeats = self._ctx.Array('d', num_workers, lock=False)
+        self._processes: Dict[int, mp.Process] = {}
+        self._controls: Dict[int, mp.Queue] = {}
+        self._restarts = {worker_id: 0 for worker_id in range(num_workers)}
+        self.assignments: Dict[int, List[str]] = {worker_id: [] for worker_id in range(num_workers)}
+        self._running = False
+
+    def _spawn(self, worker_id: int):
+        control = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_entry,
+            args=(worker_id, self.state.name, control, self._heartbeats, self.interval, self.cycle_fn),
+            name=f"shard-worker-{worker_id}",
+            daemon=True
+        )
+        self._heartbeats[worker_id] = time.time()
+        # 新进程的控制队列是空的，清空记录保证下一次分配一定下发
+        self.assignments[worker_id] = []
+        process.start()
+        self._processes[worker_id] = process
+        self._controls[worker_id] = control
+        logger.info("worker %d 已启动 (pid=%d)", worker_id, process.pid)
+
+    def _live_workers(self) -> List[int]:
+        return [worker_id for worker_id, process in self._processes.items() if process.is_alive()]
+
+    def _assign(self, assignments: Dict[int, List[str]]):
+        """下发分片，只通知分配发生变化的 worker"""
+        for worker_id, symbols in assignments.items():
+            if symbols != self.assignments.get(worker_id) or not self.assignments.get(worker_id):
+                self._controls[worker_id].put(symbols)
+        self.assignments = {worker_id: assignments.get(worker_id, []) for worker_id in self._processes}
+
+    def _rebalance(self):
+        """把交易对均匀分给所有存活 worker"""
+        live = sorted(self._live_workers())
+        if not live:
+            return
+        assignments = {worker_id: [] for worker_id in self._processes}
+        for i, symbol in enumerate(self.symbols):
+            assignments[live[i % len(live)]].append(symbol)
+        self._assign(assignments)
+
+    def _handle_failure(self, worker_id: int, reason: str):
+        orphaned = self.assignments.get(worker_id, [])
+        logger.warning("worker %d %s，转移 %d 个交易对", worker_id, reason, len(orphaned))
+        process = self._processes[worker_id]
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=5)
+
+        # 先把孤儿分片转给当前负载最小的存活 worker
+        survivors = [w for w in self._live_workers() if w != worker_id]
+        if survivors:
+            assignments = {w: list(self.assignments.get(w, [])) for w in self._processes}
+            assignments[worker_id] = []
+            for symbol in orphaned:
+                target = min(survivors, key=lambda w: len(assignments[w]))
+                assignments[target].append(symbol)
+            self._assign(assignments)
+
+        if self._restarts[worker_id] < self.max_restarts:
+            self._restarts[worker_id] += 1
+            self._spawn(worker_id)
+            self._rebalance()
+        else:
+            logger.error("worker %d 重启次数超过上限 %d，不再重启", worker_id, self.max_restarts)
+            del self._processes[worker_id]
+            self.assignments.pop(worker_id, None)
+
+    def check_workers(self):
+        """检查所有 worker 的存活和心跳"""
+        now = time.time()
+        for worker_id in list(self._processes):
+            process = self._processes[worker_id]
+            if not process.is_alive():
+                self._handle_failure(worker_id, f"已退出 (exitcode={process.exitcode})")
+            elif now - self._heartbeats[worker_id] > self.heartbeat_timeout:
+                self._handle_failure(worker_id, "心跳超时")
+
+    def start(self):
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        self._rebalance()
+        self._running = True
+
+    def run(self, check_interval: float = 1.0):
+        """启动并阻塞监控，直到被中断"""
+        self.start()
+        try:
+            while self._running:
+                time.sleep(check_interval)
+                self.check_workers()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._running = False
+        for worker_id, process in self._processes.items():
+            if process.is_alive():
+                self._controls[worker_id].put(None)
+        for process in self._processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes.clear()
+        self.state.close()
+
+    def get_status(self) -> Dict:
+        return {
+            'workers': {
+                worker_id: {
+                    'pid': process.pid,
+                    'alive': process.is_alive(),
+                    'symbols': len(self.assignments.get(worker_id, [])),
+                    'restarts': self._restarts[worker_id],
+                    'last_heartbeat': self._heartbeats[worker_id]
+                }
+                for worker_id, process in self._processes.items()
+            },
+            'shared_memory': self.state.name
+        }
+
+
+_demo_ledger = None
+
+
+async def demo_cycle(symbol: str, state: SharedMarketState):
+    """演示用周期：发布合成行情，空仓时按全局风控开 100 USDT 仓位，标记文件存在时 worker 0 崩溃一次"""
+    from fill_simulator import make_synthetic_order_book
+    from position_ledger import PositionLedger
+    global _demo_ledger
+    price = 0.0001 * (1 + (hash(symbol) % 100) / 100) * (1 + np.random.uniform(-0.01, 0.01))
+    state.publish(symbol, price, 1000.0, make_synthetic_order_book(price, levels=state.depth))
+
+    if _demo_ledger is None:
+        _demo_ledger = PositionLedger()
+    _demo_ledger.sync_positions(state.get_positions())
+    _demo_ledger.mark_to_market(state.get_prices())
+    position = _demo_ledger.get_position(symbol)
+    if not position or not position['quantity']:
+        amount = 100.0 / price
+        if _demo_ledger.check_order(symbol, amount, price, is_buy=True)['allowed']:
+            state.publish_position(symbol, _demo_ledger.apply_fill(symbol, amount, price, is_buy=True))
+
+    crash_flag = os.getenv("DEMO_CRASH_FLAG")
+    if mp.current_process().name == "shard-worker-0" and crash_flag and os.path.exists(crash_flag):
+        os.remove(crash_flag)
+        os._exit(1)
+
+
+def main():
+    import tempfile
+
+    # Example usage: 4 workers over 200 synthetic symbols, worker 0 crashes once
+    os.environ["DEMO_CRASH_FLAG"] = os.path.join(tempfile.gettempdir(), f"shard_demo_crash_{os.getpid()}")
+    symbols = [f"MEME{i}USDT" for i in range(200)]
+    supervisor = ShardSupervisor(symbols, num_workers=4, cycle_fn=demo_cycle, interval=0.5)
+    supervisor.start()
+    reader = SharedMarketState.attach(supervisor.state.name)
+
+    for second in range(6):
+        time.sleep(1)
+        if second == 1:
+            open(os.environ["DEMO_CRASH_FLAG"], "w").close()
+        supervisor.check_workers()
+        status = supervisor.get_status()['workers']
+        positions = reader.get_positions()
+        prices = reader.get_prices()
+        exposure = sum(abs(p['quantity'] * prices.get(symbol, p['avg_cost'])) for symbol, p in positions.items())
+        print({w: (s['symbols'], s['restarts']) for w, s in status.items()},
+              f"{len(prices)} prices visible, {len(positions)} positions, total exposure {exposure:.0f}")
+
+    print("\nSnapshot:")
+    print(reader.get("MEME7USDT"))
+    reader.close()
+    supervisor.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
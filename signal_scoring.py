@@ -0,0 +1,143 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 特征矩阵的列顺序
+FEATURE_COLUMNS = ('social_sentiment', 'technical_score', 'whale_activity', 'volume', 'change_24h')
+
+SIGNAL_REASONS = {
+    'BUY': np.array([
+        '社交媒体情绪积极',
+        '技术指标显示上涨趋势',
+        '大户地址增持',
+        '交易量显著增加',
+        '突破关键阻力位'
+    ]),
+    'SELL': np.array([
+        '社交媒体情绪转向消极',
+        '技术指标显示下跌趋势',
+        '大户地址减持',
+        '交易量萎缩',
+        '跌破关键支撑位'
+    ])
+}
+
+
+class SignalScorer:
+    """向量化的信号打分引擎
+
+    把整个币种池组成 币种 × (情绪, 技术, 大户, 成交量, 涨跌) 的特征矩阵，
+    加权、截断、阈值判断和原因选择都以数组运算完成，只返回通过阈值的信号。
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, min_confidence: int = 50,
+                 max_confidence: int = 95, signal_threshold: int = 70, buy_sentiment: float = 60):
+        self.weights = weights or {
+            'social_sentiment': 0.3,
+            'technical_score': 0.4,
+            'whale_activity': 0.3,
+            'volume': 0.0,
+            'change_24h': 0.0
+        }
+        # 大户活跃度取值 0-4，乘 20 映射到 0-80 后再加权
+        self.scales = {'whale_activity': 20}
+        self._terms = [(i, self.scales.get(column), self.weights[column])
+                       for i, column in enumerate(FEATURE_COLUMNS) if self.weights.get(column)]
+        self.min_confidence = min_confidence
+        self.max_confidence = max_confidence
+        self.signal_threshold = signal_threshold
+        self.buy_sentiment = buy_sentiment
+
+    def build_matrix(self, market_data: Dict[str, Dict]):
+        """把 {coin: data} 转换为币种列表、特征矩阵和价格向量"""
+        coins = list(market_data)
+        features = np.array([[data[column] for column in FEATURE_COLUMNS] for data in market_data.values()],
+                            dtype=np.float64).reshape(len(coins), len(FEATURE_COLUMNS))
+        prices = np.array([data['price'] for data in market_data.values()], dtype=np.float64)
+        return coins, features, prices
+
+    def score_arrays(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """对特征矩阵打分，返回每个币种的置信度、方向和原因下标"""
+        # 按逐个计算时的顺序逐列相乘累加，浮点结果逐位一致；矩阵乘法的
+        # 求和顺序不同，会把 51.0 算成 50.99999999999999，截断后差 1
+        total = np.zeros(len(features))
+        for i, scale, weight in self._terms:
+            column = features[:, i] * scale if scale is not None else features[:, i]
+            total = total + column * weight
+        # int() 向零截断，与逐个计算时的取整方式一致
+        confidence = np.clip(np.trunc(total), self.min_confidence, self.max_confidence)
+        confidence = confidence.astype(np.int64)
+        sentiment = features[:, 0]
+        is_buy = sentiment > self.buy_sentiment
+        reason_index = np.select(
+            [sentiment > 70, features[:, 1] > 70, features[:, 2] > 3],
+            [0, 1, 2],
+            default=3
+        )
+        return {
+            'confidence': confidence,
+            'is_buy': is_buy,
+            'reason_index': reason_index,
+            'passed': confidence > self.signal_threshold
+        }
+
+    def score(self, market_data: Dict[str, Dict]) -> List[Dict]:
+        """给整个币种池打分，只返回通过阈值的信号"""
+        if not market_data:
+            return []
+        coins, features, prices = self.build_matrix(market_data)
+        scores = self.score_arrays(features)
+
+        passed = np.flatnonzero(scores['passed'])
+        is_buy = scores['is_buy'][passed]
+        reason_index = scores['reason_index'][passed]
+        reasons = np.where(is_buy, SIGNAL_REASONS['BUY'][reason_index], SIGNAL_REASONS['SELL'][reason_index])
+        timestamp = datetime.utcnow()
+
+        return [
+            {
+                'coin': coins[i],
+                'signal': 'BUY' if buy else 'SELL',
+                'confidence': int(confidence),
+                'reason': str(reason),
+                'price': float(prices[i]),
+                'timestamp': timestamp
+            }
+            for i, buy, confidence, reason in zip(passed, is_buy, scores['confidence'][passed], reasons)
+        ]
+
+
+async def main():
+    scorer = SignalScorer()
+    rng = np.random.default_rng(42)
+
+    # Example benchmark: scoring cost as the universe grows
+    print(f"{'coins':>8} {'matrix ms':>10} {'end-to-end ms':>14} {'signals':>8}")
+    for size in (100, 1000, 10000, 100000):
+        market_data = {
+            f"MEME{i}": {
+                'price': float(rng.uniform(1e-8, 1e-3)),
+                'volume': float(rng.integers(500000, 1500000)),
+                'change_24h': float(rng.uniform(-10, 10)),
+                'social_sentiment': int(rng.integers(0, 100)),
+                'whale_activity': int(rng.integers(0, 5)),
+                'technical_score': int(rng.integers(0, 100))
+            }
+            for i in range(size)
+        }
+        _, features, _ = scorer.build_matrix(market_data)
+
+        started = time.perf_counter()
+        scorer.score_arrays(features)
+        matrix_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        signals = scorer.score(market_data)
+        total_ms = (time.perf_counter() - started) * 1000
+        print(f"{size:>8} {matrix_ms:>10.3f} {total_ms:>14.3f} {len(signals):>8}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,19 @@
 import tweepy
 import json
+import logging
 import time
 
+logger = logging.getLogger(__name__)
+
 class SocialMediaDataCollector:
     def __init__(self, consumer_key, consumer_secret, access_token, access_token_secret):
         auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
         auth.set_access_token(access_token, access_token_secret)
         self.api = tweepy.API(auth, wait_on_rate_limit=True)
-        print("Twitter API initialized.")
+        logger.info("Twitter API initialized.")
 
     def search_tweets(self, query, count=100):
-        print(f"Searching tweets for query: '{query}'...")
+        logger.debug("Searching tweets for query: '%s'...", query)
         tweets = []
         try:
             for tweet in tweepy.Cursor(self.api.search_tweets, q=query, lang="en", tweet_mode='extended').items(count):
@@ -30,13 +33,13 @@ class SocialMediaDataCollector:
                     "hashtags": [tag["text"] for tag in tweet.entities["hashtags"]],
                     "mentions": [mention["screen_name"] for mention in tweet.entities["user_mentions"]]
                 })
-            print(f"Collected {len(tweets)} tweets for query '{query}'.")
+            logger.debug("Collected %d tweets for query '%s'.", len(tweets), query)
         except tweepy.TweepyException as e:
-            print(f"Error searching tweets: {e}")
+            logger.error("Error searching tweets: %s", e)
         return tweets
 
     def get_user_timeline(self, screen_name, count=100):
-        print(f"Getting user timeline for @{screen_name}...")
+        logger.debug("Getting user timeline for @%s...", screen_name)
         tweets = []
         try:
             for tweet in tweepy.Cursor(self.api.user_timeline, screen_name=screen_name, tweet_mode='extended').items(count):
@@ -56,9 +59,9 @@ class SocialMediaDataCollector:
                     "hashtags": [tag["text"] for tag in tweet.entities["hashtags"]],
                     "mentions": [mention["screen_name"] for mention in tweet.entities["user_mentions"]]
                 })
-            print(f"Collected {len(tweets)} tweets from @{screen_name}.")
+            logger.debug("Collected %d tweets from @%s.", len(tweets), screen_name)
         except tweepy.TweepyException as e:
-            print(f"Error getting user timeline: {e}")
+            logger.error("Error getting user timeline: %s", e)
         return tweets
 
 async def main():
@@ -0,0 +1,213 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 排行榜名称及其对应的输入字段
+BOARD_FIELDS = {
+    'volume_change': 'volume_change',
+    'price_change': 'price_change',
+    'sentiment': 'sentiment',
+    'whale': 'whale_activity'
+}
+
+DEFAULT_MOMENTUM_WEIGHTS = {
+    'volume_change': 0.35,
+    'price_change': 0.35,
+    'sentiment': 0.2,
+    'whale_activity': 0.1
+}
+
+# 动量分各字段的归一化参数 (中心, 尺度)：(值 - 中心) / 尺度 截断到 [-1, 1]，
+# 各字段量纲一致后权重才代表各自的占比
+MOMENTUM_SCALES = {
+    'volume_change': (0.0, 200.0),   # 成交量变化百分比，新币动辄数百
+    'price_change': (0.0, 10.0),     # 24h 涨跌幅百分比
+    'sentiment': (50.0, 50.0),       # 情绪分 0-100
+    'whale_activity': (0.0, 4.0)     # 大户活跃度 0-4
+}
+
+
+def normalize_momentum_field(field: str, value: float) -> float:
+    """把一个动量字段缩放并截断到 [-1, 1]，未配置的字段原样返回"""
+    scale = MOMENTUM_SCALES.get(field)
+    if scale is None:
+        return value
+    center, width = scale
+    return max(-1.0, min(1.0, (value - center) / width))
+
+
+class _Leaderboard:
+    """带时间衰减的增量排行榜
+
+    分数按半衰期指数衰减。存入堆的排序键是 score * 2^((t_update - t0) / half_life)，
+    任意时刻的衰减后分数都等于键乘以同一个正因子，因此随时间推移无需重排。
+    更新只压入新条目，旧条目在查询时惰性丢弃。
+    """
+
+    def __init__(self, half_life: float, epoch: float):
+        self.half_life = half_life
+        self.epoch = epoch
+        self._heap: List[Tuple[float, int, str]] = []
+        self._current: Dict[str, Tuple[float, int]] = {}
+        self._versions = itertools.count()
+
+    def _key(self, score: float, timestamp: float) -> float:
+        return score * 2.0 ** ((timestamp - self.epoch) / self.half_life)
+
+    def update(self, token: str, score: float, timestamp: float):
+        key = self._key(score, timestamp)
+        version = next(self._versions)
+        self._current[token] = (key, version)
+        heapq.heappush(self._heap, (-key, version, token))
+        if len(self._heap) > 2 * len(self._current) + 64:
+            self._rebuild()
+
+    def remove(self, token: str):
+        self._current.pop(token, None)
+
+    def top(self, k: int, now: float) -> List[Tuple[str, float]]:
+        """取前 k 名，只弹出 k 个有效条目和沿途的过期条目"""
+        scale = 2.0 ** (-(now - self.epoch) / self.half_life)
+        results = []
+        valid = []
+        while self._heap and len(results) < k:
+            entry = heapq.heappop(self._heap)
+            neg_key, version, token = entry
+            if self._current.get(token, (None, None))[1] != version:
+                continue
+            valid.append(entry)
+            results.append((token, -neg_key * scale))
+        for entry in valid:
+            heapq.heappush(self._heap, entry)
+        return results
+
+    def rebase(self, epoch: float):
+        """移动时间基准，防止排序键指数溢出"""
+        factor = 2.0 ** (-(epoch - self.epoch) / self.half_life)
+        self.epoch = epoch
+        self._current = {token: (key * factor, version) for token, (key, version) in self._current.items()}
+        self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(-key, version, token) for token, (key, version) in self._current.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._current)
+
+
+class TokenRankingIndex:
+    """代币排行索引
+
+    接收逐个代币的流式更新（成交量变化、价格变化、情绪、大户活跃度），
+    增量维护各单项榜单和综合动量榜（各字段先按 MOMENTUM_SCALES 归一化再
+    加权）。分数随时间衰减，长时间没有更新的
+    代币被移出索引，查询 “动量前 50” 时不需要对整个代币池重新排序。
+    """
+
+    # 排序键的指数超过这个值时移动时间基准
+    _MAX_EXPONENT = 512
+
+    def __init__(self, half_life: float = 900.0, ttl: float = 3600.0,
+                 momentum_weights: Optional[Dict[str, float]] = None):
+        self.half_life = half_life
+        self.ttl = ttl
+        self.momentum_weights = momentum_weights or DEFAULT_MOMENTUM_WEIGHTS
+        now = time.time()
+        self.boards = {name: _Leaderboard(half_life, now) for name in list(BOARD_FIELDS) + ['momentum']}
+        self._latest: Dict[str, Dict[str, float]] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+
+    def update(self, token: str, timestamp: Optional[float] = None, **values):
+        """写入一个代币的最新观测值"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        self._maybe_rebase(timestamp)
+
+        latest = self._latest.setdefault(token, {})
+        for board, field in BOARD_FIELDS.items():
+            value = values.get(field)
+            if value is not None:
+                latest[field] = float(value)
+                self.boards[board].update(token, float(value), timestamp)
+
+        momentum = sum(weight * normalize_momentum_field(field, latest[field])
+                       for field, weight in self.momentum_weights.items() if field in latest)
+        self.boards['momentum'].update(token, momentum, timestamp)
+
+        self._last_seen[token] = timestamp
+        heapq.heappush(self._expiry_heap, (timestamp, token))
+        if len(self._expiry_heap) > 2 * len(self._last_seen) + 64:
+            self._compact_expiry()
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """移除超过 ttl 没有更新的代币"""
+        now = now if now is not None else time.time()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] < now - self.ttl:
+            seen, token = heapq.heappop(self._expiry_heap)
+            if self._last_seen.get(token) == seen:
+                for board in self.boards.values():
+                    board.remove(token)
+                del self._last_seen[token]
+                del self._latest[token]
+                expired.append(token)
+        return expired
+
+    def _compact_expiry(self):
+        self._expiry_heap = [(seen, token) for token, seen in self._last_seen.items()]
+        heapq.heapify(self._expiry_heap)
+
+    def top(self, board: str = 'momentum', k: int = 50, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """查询某个榜单的前 k 名及其衰减后分数"""
+        now = now if now is not None else time.time()
+        self.expire(now)
+        return self.boards[board].top(k, now)
+
+    def _maybe_rebase(self, timestamp: float):
+        for board in self.boards.values():
+            if (timestamp - board.epoch) / self.half_life > self._MAX_EXPONENT:
+                board.rebase(timestamp)
+
+    def __len__(self):
+        return len(self._last_seen)
+
+
+async def main():
+    index = TokenRankingIndex(half_life=600, ttl=1800)
+    tokens = [f"MEME{i}" for i in range(20000)]
+
+    # Example usage: stream 200k updates over a simulated hour
+    started = time.perf_counter()
+    now = time.time()
+    for step in range(200000):
+        token = random.choice(tokens)
+        index.update(
+            token,
+            timestamp=now + step * 0.018,
+            volume_change=random.expovariate(1 / 80) - 40,
+            price_change=random.gauss(0, 10),
+            sentiment=random.uniform(0, 100),
+            whale_activity=random.randint(0, 4)
+        )
+    elapsed = time.perf_counter() - started
+    print(f"200000 updates in {elapsed:.2f}s ({elapsed / 200000 * 1e6:.1f} us/update), {len(index)} live tokens")
+
+    query_time = now + 200000 * 0.018
+    started = time.perf_counter()
+    leaders = index.top('momentum', k=50, now=query_time)
+    print(f"Top 50 by momentum in {(time.perf_counter() - started) * 1000:.3f} ms")
+    for token, score in leaders[:5]:
+        print(f"  {token}: {score:.2f}")
+
+    # Each field's weighted contribution now spans a range proportional to its weight
+    print("Momentum contribution range per field:")
+    for field, weight in index.momentum_weights.items():
+        values = [weight * normalize_momentum_field(field, latest[field]) for latest in index._latest.values()]
+        print(f"  {field}: {min(values):+.3f} .. {max(values):+.3f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,10 @@ import logging
 import json
 
 from trading_config import TradingConfig, TradingSignal, TradingHistory, db
+from position_ledger import PositionLedger
+from fill_simulator import FillSimulator, make_synthetic_order_book
+from signal_scoring import SignalScorer
+from token_ranking import TokenRankingIndex
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -24,8 +28,18 @@ class TradingBotService:
             'successful_trades': 0,
             'failed_trades': 0,
             'total_profit': 0.0,
-            'today_profit': 0.0
+            'today_profit': 0.0,
+            'total_execution_cost': 0.0
         }
+        self.trade_amount = 1000  # 固定交易数量
+        self.position_ledger = PositionLedger()
+        self.fill_simulator = FillSimulator(fee_rate=0.001, latency_ms=200, queue_ahead_ratio=0.1, adverse_bps_per_ms=0.005)
+        self.order_books = {}
+        self.signal_scorer = SignalScorer()
+        self.coin_universe = ['DOGE', 'SHIB', 'PEPE', 'FLOKI', 'BONK']
+        self.ranking_index = TokenRankingIndex()
+        self.focus_size = 50  # 每轮只对动量前 N 的币种做信号和执行
+        self._last_volumes = {}
         
     def start_bot(self):
         """启动交易机器人"""
@@ -67,7 +81,8 @@ class TradingBotService:
             'running': self.is_running,
             'start_time': self.start_time.isoformat() if self.start_time else None,
             'runtime_seconds': runtime_seconds,
-            'stats': self.stats.copy()
+            'stats': self.stats.copy(),
+            'positions': self.position_ledger.get_summary()
         }
     
     def _run_bot_loop(self):
@@ -94,12 +109,18 @@ class TradingBotService:
             # 1. 获取市场数据
             market_data = self._collect_market_data()
             
+            # 用最新价格对持仓盯市
+            self.position_ledger.mark_to_market({coin: data['price'] for coin, data in market_data.items()})
+            
+            # 更新排行索引，只把动量靠前的币种交给后续的高成本环节
+            self._update_ranking(market_data)
+            focus = [coin for coin, _ in self.ranking_index.top('momentum', k=self.focus_size)]
+            
             # 2. 生成AI信号
-            signals = self._generate_ai_signals(market_data)
+            signals = self._generate_ai_signals({coin: market_data[coin] for coin in focus if coin in market_data})
             
             # 3. 执行交易决策
-            for signal in signals:
-                self._execute_trading_signal(signal)
+            self._execute_trading_signals(signals)
                 
             # 4. 更新统计数据
             self._update_statistics()
@@ -107,13 +128,33 @@ class TradingBotService:
         except Exception as e:
             logger.error(f"交易循环执行出错: {e}")
     
+    def add_coins(self, coins: List[str]):
+        """把新发现的币种加入监控池"""
+        known = set(self.coin_universe)
+        self.coin_universe.extend(coin for coin in coins if coin not in known)
+    
+    def _update_ranking(self, market_data: Dict):
+        """把本轮行情写入排行索引"""
+        now = time.time()
+        for coin, data in market_data.items():
+            last_volume = self._last_volumes.get(coin)
+            volume_change = (data['volume'] - last_volume) / last_volume * 100 if last_volume else 0.0
+            self._last_volumes[coin] = data['volume']
+            self.ranking_index.update(
+                coin,
+                timestamp=now,
+                volume_change=volume_change,
+                price_change=data['change_24h'],
+                sentiment=data['social_sentiment'],
+                whale_activity=data['whale_activity']
+            )
+    
     def _collect_market_data(self) -> Dict:
         """收集市场数据"""
         # 模拟数据收集
-        coins = ['DOGE', 'SHIB', 'PEPE', 'FLOKI', 'BONK']
         market_data = {}
         
-        for coin in coins:
+        for coin in self.coin_universe:
             market_data[coin] = {
                 'price': round(0.00001 + (hash(coin + str(time.time())) % 1000) / 100000000, 8),
                 'volume': (hash(coin + str(time.time())) % 1000000) + 500000,
@@ -122,148 +163,127 @@ class TradingBotService:
                 'whale_activity': (hash(coin + str(time.time())) % 5),
                 'technical_score': (hash(coin + str(time.time())) % 100)
             }
+            # 模拟盘口深度，供模拟成交逐档撮合
+            self.order_books[coin] = make_synthetic_order_book(
+                market_data[coin]['price'], base_size=self.trade_amount * (hash(coin + str(time.time())) % 5 + 1)
+            )
             
         return market_data
     
     def _generate_ai_signals(self, market_data: Dict) -> List[Dict]:
         """生成AI交易信号"""
-        signals = []
+        # 整个币种池一次性向量化打分，只返回通过阈值的信号
+        signals = self.signal_scorer.score(market_data)
         
-        for coin, data in market_data.items():
-            # 简单的信号生成逻辑
-            confidence = self._calculate_signal_confidence(data)
-            
-            if confidence > 70:
-                signal_type = 'BUY' if data['social_sentiment'] > 60 else 'SELL'
-                reason = self._generate_signal_reason(data, signal_type)
-                
-                signal = {
-                    'coin': coin,
-                    'signal': signal_type,
-                    'confidence': confidence,
-                    'reason': reason,
-                    'price': data['price'],
-                    'timestamp': datetime.utcnow()
-                }
-                
-                signals.append(signal)
-                
-                # 保存信号到数据库
-                self._save_signal_to_db(signal)
+        # 批量保存信号到数据库
+        if signals:
+            self._save_signals_to_db(signals)
         
         return signals
     
-    def _calculate_signal_confidence(self, data: Dict) -> int:
-        """计算信号置信度"""
-        # 综合多个因素计算置信度
-        social_weight = 0.3
-        technical_weight = 0.4
-        whale_weight = 0.3
-        
-        confidence = (
-            data['social_sentiment'] * social_weight +
-            data['technical_score'] * technical_weight +
-            data['whale_activity'] * 20 * whale_weight
-        )
-        
-        return min(95, max(50, int(confidence)))
-    
-    def _generate_signal_reason(self, data: Dict, signal_type: str) -> str:
-        """生成信号原因"""
-        reasons = {
-            'BUY': [
-                '社交媒体情绪积极',
-                '技术指标显示上涨趋势',
-                '大户地址增持',
-                '交易量显著增加',
-                '突破关键阻力位'
-            ],
-            'SELL': [
-                '社交媒体情绪转向消极',
-                '技术指标显示下跌趋势',
-                '大户地址减持',
-                '交易量萎缩',
-                '跌破关键支撑位'
-            ]
-        }
-        
-        # 根据数据选择最合适的原因
-        if data['social_sentiment'] > 70:
-            return reasons[signal_type][0]
-        elif data['technical_score'] > 70:
-            return reasons[signal_type][1]
-        elif data['whale_activity'] > 3:
-            return reasons[signal_type][2]
-        else:
-            return reasons[signal_type][3]
-    
-    def _save_signal_to_db(self, signal: Dict):
-        """保存信号到数据库"""
+    def _save_signals_to_db(self, signals: List[Dict]):
+        """批量保存信号到数据库"""
         try:
             from flask import current_app
             with current_app.app_context():
-                db_signal = TradingSignal(
-                    coin=signal['coin'],
-                    signal=signal['signal'],
-                    confidence=signal['confidence'],
-                    reason=signal['reason'],
-                    price=signal['price'],
-                    source='AI',
-                    timestamp=signal['timestamp']
-                )
-                db.session.add(db_signal)
+                db.session.add_all([
+                    TradingSignal(
+                        coin=signal['coin'],
+                        signal=signal['signal'],
+                        confidence=signal['confidence'],
+                        reason=signal['reason'],
+                        price=signal['price'],
+                        source='AI',
+                        timestamp=signal['timestamp']
+                    )
+                    for signal in signals
+                ])
                 db.session.commit()
         except Exception as e:
             logger.error(f"保存信号到数据库失败: {e}")
     
-    def _execute_trading_signal(self, signal: Dict):
-        """执行交易信号"""
-        try:
+    def _execute_trading_signals(self, signals: List[Dict]):
+        """执行本轮交易信号：风控过滤后整批模拟成交"""
+        orders = {}
+        # 本批已通过但尚未记账的加仓名义价值，计入后续订单的总敞口检查
+        pending_exposure = 0.0
+        for signal in signals:
             # 模拟交易执行
-            if signal['confidence'] > 80:
-                # 执行交易
-                trade_result = self._simulate_trade_execution(signal)
-                
-                if trade_result['success']:
-                    self.stats['successful_trades'] += 1
-                    self.stats['total_profit'] += trade_result['profit']
-                    self.stats['today_profit'] += trade_result['profit']
-                    
-                    # 保存交易记录
-                    self._save_trade_to_db(signal, trade_result)
-                    
-                    logger.info(f"交易执行成功: {signal['coin']} {signal['signal']} 盈利: {trade_result['profit']}")
-                else:
-                    self.stats['failed_trades'] += 1
-                    logger.warning(f"交易执行失败: {signal['coin']} {signal['signal']}")
-                    
-                self.stats['total_trades'] += 1
-                
-        except Exception as e:
-            logger.error(f"执行交易信号失败: {e}")
-    
-    def _simulate_trade_execution(self, signal: Dict) -> Dict:
-        """模拟交易执行"""
-        # 模拟交易结果
-        success_rate = 0.7  # 70%成功率
-        success = (hash(signal['coin'] + str(time.time())) % 100) < (success_rate * 100)
-        
-        if success:
-            # 模拟盈利
-            profit = round((hash(signal['coin'] + str(time.time())) % 50) / 10 + 1, 2)
-            if signal['signal'] == 'SELL':
-                profit *= -1  # 卖出信号可能是止损
-        else:
-            # 模拟亏损
-            profit = -round((hash(signal['coin'] + str(time.time())) % 20) / 10 + 1, 2)
-        
+            if signal['confidence'] <= 80 or signal['coin'] in orders:
+                continue
+            # 下单前基于内存账本做风控检查
+            is_buy = signal['signal'] == 'BUY'
+            risk_check = self.position_ledger.check_order(signal['coin'], self.trade_amount, signal['price'], is_buy,
+                                                          pending_exposure=pending_exposure)
+            if not risk_check['allowed']:
+                logger.warning(f"风控拒绝交易: {signal['coin']} {signal['signal']} {risk_check['reason']}")
+                continue
+            if not risk_check['reducing']:
+                pending_exposure += self.trade_amount * signal['price']
+            orders[signal['coin']] = signal
+
+        # 所有通过的订单一次性逐档撮合
+        fills = self.fill_simulator.simulate_batch(
+            self.order_books,
+            {coin: {'quantity': self.trade_amount, 'is_buy': signal['signal'] == 'BUY'} for coin, signal in orders.items()}
+        )
+        for coin, signal in orders.items():
+            try:
+                trade_result = self._build_trade_result(signal, fills.get(coin))
+                self._record_trade(signal, trade_result)
+            except Exception as e:
+                logger.error(f"执行交易信号失败: {e}")
+
+    def _build_trade_result(self, signal: Dict, fill: Optional[Dict]) -> Dict:
+        """把模拟成交结果整理为交易结果"""
+        success = bool(fill) and fill['filled_quantity'] > 0
+        if not success:
+            return {'success': False, 'profit': 0.0, 'execution_cost': 0.0, 'amount': 0.0,
+                    'executed_price': 0.0, 'fee': 0.0, 'slippage_bps': 0.0}
+
+        if fill['partial']:
+            logger.info(f"部分成交: {signal['coin']} {fill['filled_quantity']}/{self.trade_amount}")
+
+        # 执行成本 = 相对中间价的滑点 + 手续费，单独记录，不计入盈亏
+        slippage_cost = fill['notional'] * fill['slippage_bps'] / 10000
         return {
-            'success': success,
-            'profit': profit,
-            'amount': 1000,  # 固定交易金额
-            'executed_price': signal['price']
+            'success': True,
+            'profit': 0.0,
+            'execution_cost': round(slippage_cost + fill['fee'], 8),
+            'amount': fill['filled_quantity'],
+            'executed_price': fill['vwap'],
+            'fee': fill['fee'],
+            'slippage_bps': fill['slippage_bps']
         }
-    
+
+    def _record_trade(self, signal: Dict, trade_result: Dict):
+        """记账并更新统计，盈亏取自账本的已实现盈亏（扣除手续费）"""
+        if trade_result['success']:
+            coin = signal['coin']
+            before = self.position_ledger.get_position(coin)
+            position = self.position_ledger.apply_fill(
+                coin, trade_result['amount'], trade_result['executed_price'], signal['signal'] == 'BUY',
+                fee=trade_result['fee']
+            )
+            realized = position['realized_pnl'] - (before['realized_pnl'] if before else 0.0)
+            trade_result['profit'] = round(realized - trade_result['fee'], 8)
+
+            self.stats['successful_trades'] += 1
+            self.stats['total_profit'] += trade_result['profit']
+            self.stats['today_profit'] += trade_result['profit']
+            self.stats['total_execution_cost'] += trade_result['execution_cost']
+
+            # 保存交易记录
+            self._save_trade_to_db(signal, trade_result)
+
+            logger.info(f"交易执行成功: {coin} {signal['signal']} 盈亏: {trade_result['profit']} "
+                        f"执行成本: {trade_result['execution_cost']}")
+        else:
+            self.stats['failed_trades'] += 1
+            logger.warning(f"交易执行失败: {signal['coin']} {signal['signal']}")
+
+        self.stats['total_trades'] += 1
+
     def _save_trade_to_db(self, signal: Dict, trade_result: Dict):
         """保存交易记录到数据库"""
         try: